@@ -1,25 +1,37 @@
 # external libraries
 import discord
 from googletrans import Translator
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance, ImageOps
-import googleapiclient.discovery
+from googletrans.models import Translated
+from PIL import Image, ImageDraw, ImageEnhance, ImageOps
 import requests
 # import pytesseract as Tess
-import tesserocr
 
 import pymongo
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+
+# local modules
+from database import Database
+from startup import Startup
+from matcher import PatternMatcher
+from youtube import YouTubeClient, QuotaExceeded, RequestFailed
+from render import RenderEngine, RenderQueueFull, AvatarCache, render_superchat, render_meme, render_welcome
+from ocr import OCRPool, HashIndex, dhash
+from streams import StreamRepository, TagStore, TagBuffer
 
 # python built-in libraries
 import sys
+import io
 import os
 import re
 import json
 import random
+import heapq
+import hashlib
 import asyncio
 from datetime import datetime as dtime, tzinfo
 from datetime import timezone, timedelta
-from collections import deque
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
 """For local testing purpose"""
@@ -42,10 +54,12 @@ pingcord = "Pingcord#3283"
 ## TESSDATA_PREFIX is needed as environment variable
 # ./.apt/usr/share/tesseract-ocr/4.00/tessdata
 # /app/.apt/usr/share/tesseract-ocr/4.00/tessdata
+tess_path = os.getenv("TESSDATA_PREFIX", r"/app/.apt/usr/share/tesseract-ocr/4.00/tessdata")
+ocr_workers = int(os.getenv("OCR_WORKERS", 2))
+verify_workers = int(os.getenv("VERIFY_WORKERS", 2))
 
 ## local directories
 data_dir = "data"
-save_dir = "dumps"
 fonts_dir = "fonts"
 img_dir = "images"
 voices_dir = "voices"
@@ -60,41 +74,95 @@ for f_name in os.listdir(data_dir):
         # example: d["blacklist"] = {blacklist data}
         d[f_name.split(".")[0]] = json.load(f)
 
+## compiled banned links matcher (reloaded with the reload_blacklist command)
+ban_matcher = PatternMatcher(d["blacklist"]["ban_links"])
+
 ## database settings
 db_url = "mongodb+srv://{}:{}@botan.lkk4p.mongodb.net/{}?retryWrites=true&w=majority"
 db_name = "botanDB"
 db_user = os.getenv("DB_USER")
 db_pass = os.getenv("DB_PASS")
-cluster = MongoClient(db_url.format(db_user, db_pass, db_name))
-db = cluster[db_name]
-
-### preload counter for efficiency
-counter = db["settings"].find_one({"name": "counter"})
+db_workers = int(os.getenv("DB_WORKERS", 8))
+db = Database(max_workers = db_workers)
+stream_repo = StreamRepository(db)
+tag_store = TagStore(db)
+tag_buffer = TagBuffer(tag_store, flush_interval = 5, max_pending = 50, duplicate_window = 10)
 
 ## youtube api settings
 yt_key = os.getenv("YT_KEY")
 botan_ch_id = os.getenv("BOTAN_CH_ID")
-api_service_name = "youtube"
-api_version = "v3"
+yt_quota_budget = int(os.getenv("YT_QUOTA_BUDGET", 9000))
+
+## render engine settings
+render_workers = int(os.getenv("RENDER_WORKERS", 2))
+render_max_pending = int(os.getenv("RENDER_MAX_PENDING", 16))
+render_engine = RenderEngine(workers = render_workers, max_pending = render_max_pending, timeout = 20)
+avatar_cache = AvatarCache(render_engine, max_bytes = int(os.getenv("AVATAR_CACHE_BYTES", 32 * 1024 * 1024)))
 
-youtube = googleapiclient.discovery.build(
-    api_service_name, api_version, developerKey = yt_key)
+## welcome queue settings (raid mode starts at raid_threshold joins within raid_window seconds)
+welcome_concurrency = int(os.getenv("WELCOME_CONCURRENCY", 4))
+raid_threshold = int(os.getenv("RAID_THRESHOLD", 10))
+raid_window = int(os.getenv("RAID_WINDOW", 10))
 
 # Temporary storage for artworks (only urls)
-temp_artwork_cursor = db["artworks"].aggregate([{"$sample": {"size": 30}}])
 temp_art_deque = deque()
 temp_art_set = set()
-for art in temp_artwork_cursor:
-    temp_art_deque.append(art["url"])
-    temp_art_set.add(art["url"])
 
 # Temporary storage for trivia
-temp_trivia_cursor = db["trivia"].aggregate([{"$sample": {"size": 10}}])
 temp_trivia_deque = deque()
 temp_trivia_set = set()
-for trivia in temp_trivia_cursor:
-    temp_trivia_deque.append(trivia)
-    temp_trivia_set.add(trivia["id"])
+
+## startup stages (warmed concurrently while connecting to discord)
+startup = Startup(client.loop)
+
+@startup.stage("database")
+async def connect_database():
+    # building the client resolves the srv record, so it runs off the event loop
+    def connect():
+        cluster = MongoClient(db_url.format(db_user, db_pass, db_name))
+        return cluster[db_name]
+    return await db.connect(connect)
+
+### preload counter for efficiency
+@startup.stage("counter", after = ("database",))
+async def load_counter():
+    return await db["settings"].find_one({"name": "counter"})
+
+@startup.stage("youtube", after = ("database",))
+async def start_youtube():
+    youtube = YouTubeClient(yt_key, db["settings"], budget = yt_quota_budget)
+    return await youtube.start()
+
+@startup.stage("render_engine")
+async def start_render_engine():
+    return render_engine.start()
+
+@startup.stage("ocr")
+async def start_ocr_pool():
+    # every worker loads the english traineddata once, off the event loop
+    pool = OCRPool(workers = ocr_workers, path = tess_path)
+    return await client.loop.run_in_executor(None, pool.start)
+
+@startup.stage("indexes", after = ("database",))
+async def create_indexes():
+    await db["bodans"].create_index("id")
+    await db["bodans"].create_index("last_membership")
+    await stream_repo.create_indexes()
+    await tag_store.create_indexes()
+
+@startup.stage("artworks", after = ("database",))
+async def load_temp_artworks():
+    for art in await db["artworks"].aggregate([{"$sample": {"size": 30}}]):
+        temp_art_deque.append(art["url"])
+        temp_art_set.add(art["url"])
+    return temp_art_deque
+
+@startup.stage("trivia", after = ("database",))
+async def load_temp_trivia():
+    for trivia in await db["trivia"].aggregate([{"$sample": {"size": 10}}]):
+        temp_trivia_deque.append(trivia)
+        temp_trivia_set.add(trivia["id"])
+    return temp_trivia_deque
 
 # Utility Functions
 def is_integer(s):
@@ -170,12 +238,92 @@ def date_from_txt(s):
 ## Translating tools
 # fix: https://stackoverflow.com/questions/52455774/googletrans-stopped-working-with-error-nonetype-object-has-no-attribute-group
 
-gtl = Translator()
-def to_jap(m):
-    return gtl.translate(m, dest = "ja")
+class TranslationService:
+    # runs googletrans off the event loop with an LRU cache keyed on (text, dest)
+    # identical requests already in flight share the same future instead of going out twice
+
+    # googletrans translates a list one item per request, so a batch is sent as one text
+    # joined with a separator that survives translation, and split back afterwards
+    separator = "\n|||\n"
+    split_pattern = re.compile(r"\s*\|\|\|\s*")
+
+    def __init__(self, max_size = 512):
+        self.translator = Translator()
+        # googletrans shares one http session, so calls are kept on a single worker thread
+        self.executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "translate")
+        self.cache = OrderedDict()
+        self.max_size = max_size
+        self.pending = {}
+
+    def _remember(self, key, result):
+        self.cache[key] = result
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last = False)
+
+    def _translate_batch(self, texts, dest):
+        # runs on the translate thread, one request for the whole batch
+        if len(texts) == 1:
+            return [self.translator.translate(texts[0], dest = dest)]
+        joined = self.translator.translate(self.separator.join(texts), dest = dest)
+        parts = self.split_pattern.split(joined.text.strip())
+        if len(parts) != len(texts):
+            # the separator got mangled, translate them one by one instead
+            return self.translator.translate(texts, dest = dest)
+        return [Translated(joined.src, joined.dest, text, part, None) for text, part in zip(texts, parts)]
+
+    async def _fetch(self, texts, dest):
+        # translate a batch of uncached texts in one call and resolve their futures
+        keys = [(text, dest) for text in texts]
+        try:
+            translate = partial(self._translate_batch, texts, dest)
+            results = await client.loop.run_in_executor(self.executor, translate)
+        except Exception as e:
+            for key in keys:
+                self.pending.pop(key).set_exception(e)
+            return
+        for key, result in zip(keys, results):
+            self._remember(key, result)
+            self.pending.pop(key).set_result(result)
+
+    async def translate_many(self, texts, dest):
+        # translate a list of texts as one batched request, returns results in the same order
+        futures = []
+        to_fetch = []
+        for text in texts:
+            key = (text, dest)
+            future = client.loop.create_future()
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                future.set_result(self.cache[key])
+            elif key in self.pending:
+                future = self.pending[key]
+            else:
+                self.pending[key] = future
+                to_fetch.append(text)
+            futures.append(future)
+        if to_fetch:
+            await self._fetch(to_fetch, dest)
+        return [await asyncio.shield(future) for future in futures]
+
+    async def translate(self, text, dest):
+        return (await self.translate_many([text], dest))[0]
 
-def to_eng(m):
-    return gtl.translate(m, dest = "en")
+translator = TranslationService()
+
+async def to_jap(m):
+    return await translator.translate(m, dest = "ja")
+
+async def to_eng(m):
+    return await translator.translate(m, dest = "en")
+
+async def translate_embed(embed):
+    # translate an embed's title and description to english together
+    fields = [field for field in ("title", "description") if getattr(embed, field)]
+    translated = await translator.translate_many([getattr(embed, field) for field in fields], dest = "en")
+    for field, result in zip(fields, translated):
+        setattr(embed, field, result.text)
+    return embed
 
 ## internal discord tools
 async def _dm_member(member_id, message, embed = False, attachment_url = None):
@@ -201,43 +349,189 @@ async def _dm_member(member_id, message, embed = False, attachment_url = None):
     return None
 
 ## Membership tools
-async def _check_membership_dates(res = None, msg = None):
-    # Performs a mass check on membership dates and delete expired membership with a default message
-    # Returns an expired_membership list {id, last_membership}
-
-    # Get all data from bodans
-    expired_memberships = []
-    expired_start_date = dtime.now(tz = timezone.utc) - timedelta(days = 31)
-
-    message_title = "Zoopass Membership Expired"
-    message_desc = "Your access to our Botan's members-only channel has just expired!"
-    message_desc += "\nYou may renew your membership by sending another updated verification photo using the ``verify`` command."
-    message_desc += " Thank you so much for your cotinued support of our precious lioness!"
-    message_image = "https://media.discordapp.net/attachments/735145401094504538/798419209112518687/botan_cat.jpg"
-
-    for bodan in db["bodans"].find():
-        # For each bodan, if membership date ended (31 days) 30 days with one day buffer
-        if (not bodan["last_membership"]) or bodan["last_membership"].replace(tzinfo = timezone.utc) < expired_start_date:
-            # Add to delete list
-            expired_memberships.append(bodan)
-
-            # Delete from database
-            db["bodans"].delete_one(bodan)
+membership_expired_title = "Zoopass Membership Expired"
+membership_expired_desc = "Your access to our Botan's members-only channel has just expired!"
+membership_expired_desc += "\nYou may renew your membership by sending another updated verification photo using the ``verify`` command."
+membership_expired_desc += " Thank you so much for your cotinued support of our precious lioness!"
+membership_expired_image = "https://media.discordapp.net/attachments/735145401094504538/798419209112518687/botan_cat.jpg"
+
+def expired_memberships_query(now = None):
+    # membership date ended (31 days) 30 days with one day buffer, or no date at all
+    expired_start_date = (now or dtime.now(tz = timezone.utc)) - timedelta(days = 31)
+    return {"$or": [{"last_membership": {"$lt": expired_start_date}}, {"last_membership": None}]}
+
+async def _expire_memberships(bodans, concurrency = 5):
+    # remove the zoopass role from and dm every member whose membership expired (already deleted from db)
+    # runs up to concurrency members at a time, discord.py waits out rate limits on its own
+    # returns a summary of what happened
+    summary = {"expired": len(bodans), "roles_removed": 0, "not_in_server": 0, "dms_sent": 0, "dms_failed": 0, "errors": 0}
+    botan_guild = client.get_guild(d["discord_ids"]["guild"])
+    zoopass_role = botan_guild.get_role(d["discord_ids"]["zoopass_role"])
+    semaphore = asyncio.Semaphore(concurrency)
 
+    async def expire(bodan):
+        async with semaphore:
             # Remove zoopass role from user
-            botan_guild = client.get_guild(d["discord_ids"]["guild"])
             target_member = botan_guild.get_member(bodan["id"])
+            if not target_member:
+                summary["not_in_server"] += 1
+                return
+            try:
+                await target_member.remove_roles(zoopass_role)
+                summary["roles_removed"] += 1
+            except discord.HTTPException as e:
+                summary["errors"] += 1
+                print("Failed to remove zoopass from {}: {!r}".format(bodan["id"], e))
 
-            zoopass_role_id = d["discord_ids"]["zoopass_role"]
-            zoopass_role = botan_guild.get_role(zoopass_role_id)
+            # dm expired membership
+            try:
+                await _dm_member(bodan["id"], "{}\n{}".format(membership_expired_title, membership_expired_desc), embed = True, attachment_url = membership_expired_image)
+                summary["dms_sent"] += 1
+            except discord.HTTPException:
+                # usually dms closed
+                summary["dms_failed"] += 1
 
-            await target_member.remove_roles(zoopass_role)
+    await asyncio.gather(*(expire(bodan) for bodan in bodans))
+    return summary
 
-            # dm expired membership
-            await _dm_member(bodan["id"], "{}\n{}".format(message_title, message_desc), embed = True, attachment_url = message_image)
+async def _check_membership_dates(res = None, msg = None):
+    # Performs a mass check on membership dates and delete expired membership with a default message
+    # Returns an expired_membership list {id, last_membership} and a summary of the role removals and dms
+    query = expired_memberships_query()
+    expired_memberships = await db["bodans"].find(query, projection = {"_id": False, "id": True, "last_membership": True})
+    if not expired_memberships:
+        return [], await _expire_memberships([])
+
+    # Delete from database in one go (query repeated so members who renewed in between are kept)
+    expired_ids = [bodan["id"] for bodan in expired_memberships]
+    await db["bodans"].delete_many(dict(query, id = {"$in": expired_ids}))
+
+    return expired_memberships, await _expire_memberships(expired_memberships)
+
+class MembershipExpiry:
+    # min-heap of (expiry deadline, member id) so every membership expires at its exact deadline
+    # loaded once at startup, kept up to date by verify, set_zoopass and del_zoopass
+    # rescheduled or cancelled entries stay in the heap and are skipped when they reach the top
+
+    def __init__(self, retry_delay = 60):
+        self.retry_delay = retry_delay
+        self.heap = []
+        self.deadlines = {}
+        self.changed = asyncio.Event()
+
+    @staticmethod
+    def deadline(last_membership):
+        # same 31 days as expired_memberships_query
+        if not last_membership:
+            return dtime.now(tz = timezone.utc)
+        return last_membership.replace(tzinfo = timezone.utc) + timedelta(days = 31)
+
+    def schedule(self, member_id, last_membership):
+        deadline = self.deadline(last_membership)
+        self.deadlines[member_id] = deadline
+        heapq.heappush(self.heap, (deadline, member_id))
+        # drop stale entries once they outnumber the live ones
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [(deadline, member_id) for member_id, deadline in self.deadlines.items()]
+            heapq.heapify(self.heap)
+        self.changed.set()
+
+    def cancel(self, member_id):
+        self.deadlines.pop(member_id, None)
+        self.changed.set()
+
+    def _is_current(self, entry):
+        deadline, member_id = entry
+        return self.deadlines.get(member_id) == deadline
+
+    def _pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            if self._is_current(entry):
+                due.append(entry[1])
+                del self.deadlines[entry[1]]
+        return due
+
+    async def load(self):
+        for bodan in await db["bodans"].find({}, projection = {"_id": False, "id": True, "last_membership": True}):
+            if bodan["id"] not in self.deadlines:
+                self.schedule(bodan["id"], bodan["last_membership"])
+        return self
+
+    async def _expire(self, member_ids):
+        # the database has the final say, members renewed through another path are rescheduled
+        query = dict(expired_memberships_query(), id = {"$in": member_ids})
+        expired_memberships = await db["bodans"].find(query, projection = {"_id": False, "id": True, "last_membership": True})
+        expired_ids = {bodan["id"] for bodan in expired_memberships}
+        renewed = [member_id for member_id in member_ids if member_id not in expired_ids]
+        for bodan in await db["bodans"].find({"id": {"$in": renewed}}, projection = {"_id": False, "id": True, "last_membership": True}):
+            self.schedule(bodan["id"], bodan["last_membership"])
+        if not expired_memberships:
+            return [], None
+
+        await db["bodans"].delete_many(dict(expired_memberships_query(), id = {"$in": list(expired_ids)}))
+        return expired_memberships, await _expire_memberships(expired_memberships)
+
+    async def _report(self, expired_memberships, summary):
+        # a failed log message must not stop the scheduler
+        lg_ch = client.get_channel(d["discord_ids"]["log"])
+        m = "\n".join("{}: {}".format(bodan["id"], bodan["last_membership"]) for bodan in expired_memberships)
+        try:
+            await lg_ch.send(m[:2000])
+            await lg_ch.send("Memberships expired: " + ", ".join("{} {}".format(value, key.replace("_", " ")) for key, value in summary.items()))
+        except Exception as e:
+            print("Membership expiry report failed: {!r}".format(e))
+
+    async def _retry(self, func, name):
+        # keep trying a startup step, the scheduler can't run without it
+        while True:
+            try:
+                return await func()
+            except Exception as e:
+                print("Membership expiry {} failed, retrying in {}s: {!r}".format(name, self.retry_delay, e))
+                await asyncio.sleep(self.retry_delay)
+
+    async def run(self):
+        # memberships that expired while the bot was offline go in one sweep, the rest are scheduled
+        expired_memberships, summary = await self._retry(_check_membership_dates, "startup sweep")
+        if expired_memberships:
+            await self._report(expired_memberships, summary)
+        await self._retry(self.load, "load")
+        while not client.is_closed():
+            self.changed.clear()
+            while self.heap and not self._is_current(self.heap[0]):
+                heapq.heappop(self.heap)
+            if not self.heap:
+                await self.changed.wait()
+                continue
 
-    # Returns expired_memberships list
-    return expired_memberships
+            # sleep until the next deadline, or until the schedule changes
+            delay = (self.heap[0][0] - dtime.now(tz = timezone.utc)).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout = min(delay, 3600))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # everything already due expires together (e.g. the backlog after a restart)
+            due = self._pop_due(dtime.now(tz = timezone.utc))
+            try:
+                expired_memberships, summary = await self._expire(due)
+            except Exception as e:
+                print("Membership expiry failed: {!r}".format(e))
+                # try these members again a bit later instead of forgetting them
+                retry_at = dtime.now(tz = timezone.utc) + timedelta(seconds = self.retry_delay)
+                for member_id in due:
+                    if member_id not in self.deadlines:
+                        self.deadlines[member_id] = retry_at
+                        heapq.heappush(self.heap, (retry_at, member_id))
+                continue
+            if expired_memberships:
+                await self._report(expired_memberships, summary)
+
+membership_expiry = MembershipExpiry()
 
 ## Live Streaming tools
 """stream's data template
@@ -248,8 +542,10 @@ async def _check_membership_dates(res = None, msg = None):
     "scheduled_start_time"
     "actual_start_time"
     "actual_end_time"
-    "tag_count": 1
-    "tags": {
+    "tag_count": 1 (tags are stored in db["stream_tags"], see streams.py)
+    "archive_link_msg": id of the video link message in the archive channel
+    "archive_msgs": [{"id": message id, "hash": content hash of the embed page}, ...]
+    "tags": { (legacy, streams tagged before stream_tags)
         "0": {
             "author_id": author's id,
             "timestamp": datetime,
@@ -261,47 +557,57 @@ async def _check_membership_dates(res = None, msg = None):
 """
 async def process_tags(vid_id, offset = 13, overwrite = False):
     botan_guild = client.get_guild(d["discord_ids"]["guild"])
-    vid_data = db["streams"].find_one({"id": vid_id})
+    vid_data = await stream_repo.get(vid_id)
     lg_ch = client.get_channel(d["discord_ids"]["log"])
 
     # if tag_count doesn't exist or is zero, return
     if not vid_data.get("tag_count"):
         return
-    
-    # convert tags to list (important: items in tags mutating will cause tags_dict to mutate too)
-    tags_dict = vid_data["tags"]
-    tags = [tags_dict[str(k)] for k in range(len(tags_dict))]
-
-    if len(tags) == 0:
-        return
 
-    # If seconds don't exist or overwrite is true, use timestamp to calculate all seconds, store back into db["streams"]
-    if (not tags[0].get("seconds")) or overwrite:
-        actual_start_time = vid_data["actual_start_time"].replace(tzinfo = timezone.utc)
+    # read tags back in batches, legacy tags on the stream document first
+    legacy_tags = vid_data.get("tags")
+    legacy_changed = False
+    msg_list = []
+    async for tags in tag_store.iter_batches(vid_id, legacy_tags):
+        # If seconds don't exist or overwrite is true, use timestamp to calculate seconds, store them back
+        missing = [tag for tag in tags if overwrite or tag.get("seconds") is None]
+        if missing:
+            actual_start_time = vid_data["actual_start_time"].replace(tzinfo = timezone.utc)
+            for tag in missing:
+                timestamp = tag["timestamp"].replace(tzinfo = timezone.utc)
+                tag["seconds"] = max(int((timestamp - actual_start_time).total_seconds()) - offset, 0)
+            await tag_store.set_seconds([tag for tag in missing if "_id" in tag])
+            legacy_changed = legacy_changed or any("_id" not in tag for tag in missing)
+
+        # resolve every author's booster profile in one pass
+        profiles = await booster_profiles(set(tag["author_id"] for tag in tags))
+
+        # write all tags into separate messages in a list
         for tag in tags:
-            timestamp = tag["timestamp"].replace(tzinfo = timezone.utc)
-            tag["seconds"] = max(int((timestamp - actual_start_time).total_seconds()) - offset, 0)
-        db["streams"].update_one({"id": vid_id}, {"$set": {"tags": tags_dict}})
+            author = botan_guild.get_member(tag["author_id"])
+            booster = profiles[tag["author_id"]]
+            display_name = display_nickname(author, booster)
+            display_name = "<:Booster:751174312018575442> {}".format(display_name) if booster else display_name
 
-    # write all tags into separate messages in a list
-    msg_list = []
-    for tag in tags:
-        author = botan_guild.get_member(tag["author_id"])
-        display_name = booster_nickname(author)
-        display_name = "<:Booster:751174312018575442> {}".format(display_name) if is_booster(author) else display_name
+            minutes, seconds = divmod(tag["seconds"], 60)
+            hours, minutes = divmod(minutes, 60)
+
+            if hours:
+                display_time = "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
+            else:
+                display_time = "{}:{:02d}".format(minutes, seconds)
 
-        minutes, seconds = divmod(tag["seconds"], 60)
-        hours, minutes = divmod(minutes, 60)
+            vid_url = "https://youtu.be/{}?t={}".format(vid_id, tag["seconds"])
+            msg = tag["text"]
 
-        if hours:
-            display_time = "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
-        else:
-            display_time = "{}:{:02d}".format(minutes, seconds)
+            msg_list.append("{}\n[{}]({}) {}".format(display_name, display_time, vid_url, msg))
 
-        vid_url = "https://youtu.be/{}?t={}".format(vid_id, tag["seconds"])
-        msg = tag["text"]
+    # legacy tags were updated in place (items in the batches are the dict's values)
+    if legacy_changed:
+        await stream_repo.update(vid_id, {"tags": legacy_tags})
 
-        msg_list.append("{}\n[{}]({}) {}".format(display_name, display_time, vid_url, msg))
+    if not msg_list:
+        return
 
     # while there are still items in the list, make a new embed with a title
     title = vid_data["title"]
@@ -320,12 +626,57 @@ async def process_tags(vid_id, offset = 13, overwrite = False):
         m = "\n\n".join(msg_list[start_index:i])
         embed = discord.Embed(title = title, description = m, colour = embed_color)
         embed_list.append(embed)
-    await lg_ch.send("here")
-    # if msg_ids exist, edit messages, else send messages !!! wip
+
+    # if the archive was already posted, edit the pages that changed, else send messages
     ar_ch = client.get_channel(d["discord_ids"]["archive_stream"])
-    await ar_ch.send("https://www.youtube.com/watch?v=" + vid_id)
-    for embed in embed_list:
-        await ar_ch.send(content = None, embed = embed)
+    archive_link_msg = vid_data.get("archive_link_msg")
+    if archive_link_msg:
+        try:
+            await client.http.get_message(ar_ch.id, archive_link_msg)
+        except discord.NotFound:
+            # link was deleted by hand, post it again
+            archive_link_msg = None
+    if not archive_link_msg:
+        archive_link_msg = (await ar_ch.send("https://www.youtube.com/watch?v=" + vid_id)).id
+        await stream_repo.update(vid_id, {"archive_link_msg": archive_link_msg})
+    archive_msgs = vid_data.get("archive_msgs", [])
+    edited = added = deleted = 0
+    try:
+        for i, embed in enumerate(embed_list):
+            embed_data = embed.to_dict()
+            page_hash = hashlib.sha1(json.dumps(embed_data, sort_keys = True).encode()).hexdigest()
+            if i < len(archive_msgs):
+                if archive_msgs[i]["hash"] == page_hash:
+                    continue
+                try:
+                    await client.http.edit_message(ar_ch.id, archive_msgs[i]["id"], embed = embed_data)
+                    archive_msgs[i]["hash"] = page_hash
+                    edited += 1
+                    continue
+                except discord.NotFound:
+                    # page was deleted by hand, post it again
+                    pass
+            page = {"id": (await ar_ch.send(content = None, embed = embed)).id, "hash": page_hash}
+            if i < len(archive_msgs):
+                archive_msgs[i] = page
+            else:
+                archive_msgs.append(page)
+            added += 1
+
+        # remove pages the archive no longer needs
+        while len(archive_msgs) > len(embed_list):
+            try:
+                await client.http.delete_message(ar_ch.id, archive_msgs[-1]["id"])
+            except discord.NotFound:
+                pass
+            archive_msgs.pop()
+            deleted += 1
+    finally:
+        # save what was posted even if a page failed, so the next run edits it instead of posting it again
+        await stream_repo.update(vid_id, {"archive_msgs": archive_msgs})
+
+    m = "Tag archive for {}: {} pages, {} edited, {} added, {} deleted"
+    await lg_ch.send(m.format(vid_id, len(embed_list), edited, added, deleted))
 
 ## Art Manipulation tools
 def add_corners(im, rad):
@@ -342,19 +693,20 @@ def add_corners(im, rad):
     return im
 
 ### Tesseract text detection
-async def _detect_image_text(img_url):
-    # Uses Tesseract to detect text from url img 
-    # return tuple of two possible text: normal and inverted
-
-    # Set partial function for image_to_text
-    tess_path = r"/app/.apt/usr/share/tesseract-ocr/4.00/tessdata"
-    img_to_txt = partial(tesserocr.image_to_text, path = tess_path)
-
-    # Get image from url
+def _download_image(img_url):
     img_response = requests.get(img_url, stream=True)
     img_response.raw.decode_content = True
     img = Image.open(img_response.raw)
     img.load()
+    return img
+
+async def _detect_image_text(img_url):
+    # Uses Tesseract to detect text from url img 
+    # return tuple of two possible text: normal and inverted
+    ocr_pool = await startup.wait("ocr")
+
+    # Get image from url (off the event loop)
+    img = await client.loop.run_in_executor(None, _download_image, img_url)
 
     # sharpen image
     enhancer = ImageEnhance.Sharpness(img)
@@ -369,33 +721,389 @@ async def _detect_image_text(img_url):
 
     inverted_img = ImageOps.invert(img)
 
-    # get text (run as coroutine to not block the event loop)
-    text = await client.loop.run_in_executor(None, img_to_txt, img)
-
-    # get inverted text (run as coroutine to not block the event loop)
-    inverted_text = await client.loop.run_in_executor(None, img_to_txt, inverted_img)
-        
+    # get normal and inverted text at the same time on the ocr workers
+    text, inverted_text = await asyncio.gather(ocr_pool.image_to_text(img), ocr_pool.image_to_text(inverted_img))
     return (text, inverted_text)
 
+async def _detect_image_date(img):
+    # fast path for membership screenshots, only looks for the billing date
+    # returns the first date found by either the normal or the inverted pass, or None
+    ocr_pool = await startup.wait("ocr")
+    line, texts = await ocr_pool.find_text(img, date_from_txt)
+    return date_from_txt(line) if line else None
+
 ## Nsfw utility tools
-def is_horny(user):
-    member = db["members"].find_one({"id": user.id})
+async def is_horny(user):
+    member = await db["members"].find_one({"id": user.id})
     return member and member.get("nsfw", None) and member["nsfw"].get("is_horny", None)
 
 ## Boosters utility tools
-def is_booster(user):
-    # checks if user is a booster and returns the booster's data
-    return db["boosters"].find_one({"id": user.id})
+class BoosterCache:
+    # in-memory write-through copy of db["boosters"], keyed by user id
+    # loaded once at startup, every booster write goes through insert/update so both stay in sync
+
+    def __init__(self):
+        self.boosters = {}
+
+    async def load(self):
+        for booster in await db["boosters"].find({}, projection = {"_id": False}):
+            self.boosters[booster["id"]] = booster
+        return self
+
+    def get(self, user_id):
+        return self.boosters.get(user_id)
+
+    def lookup(self, user_ids):
+        # bulk lookup, returns {user id: booster data or None}
+        return {user_id: self.boosters.get(user_id) for user_id in user_ids}
+
+    async def insert(self, booster_data):
+        self.boosters[booster_data["id"]] = dict(booster_data)
+        await db["boosters"].insert_one(booster_data)
+
+    async def update(self, user_id, fields):
+        # set fields on a cached booster and write them through to the database
+        if user_id in self.boosters:
+            self.boosters[user_id].update(fields)
+        await db["boosters"].update_one({"id": user_id}, {"$set": fields})
 
-def booster_nickname(user):
+booster_cache = BoosterCache()
+
+@startup.stage("boosters", after = ("database",))
+async def load_boosters():
+    return await booster_cache.load()
+
+def display_nickname(user, booster):
     # if user is a booster and has a booster nickname, return nickname. 
-    booster = db["boosters"].find_one({"id": user.id})
     if booster and booster["nickname"]:
         return booster["nickname"]
     # else return guild nickname or user's name depending on the class type
     return user.nick if isinstance(user, discord.Member) and user.nick else user.name
 
+async def booster_profiles(user_ids):
+    # bulk version of is_booster for many users at once
+    cache = await startup.wait("boosters")
+    return cache.lookup(user_ids)
+
+async def is_booster(user):
+    # checks if user is a booster and returns the booster's data
+    cache = await startup.wait("boosters")
+    return cache.get(user.id)
+
+async def booster_nickname(user):
+    return display_nickname(user, await is_booster(user))
+
 ## Youtube Members utility tools
+"""verification image document in db["verification_images"]
+{
+    "hash": str (hex perceptual hash of the screenshot)
+    "member_id": int
+    "date": datetime (billing date read from the screenshot) or None
+    "submitted": datetime
+}
+"""
+class VerificationImages:
+    # perceptual hashes of recent verification screenshots, indexed in memory for near-duplicate lookups
+    # loaded once at startup, new submissions are written through to db["verification_images"]
+
+    def __init__(self, keep_days = 90):
+        self.keep_days = keep_days
+        self.index = HashIndex()
+
+    async def load(self):
+        await db["verification_images"].create_index("submitted")
+        since = dtime.now(tz = timezone.utc) - timedelta(days = self.keep_days)
+        for entry in await db["verification_images"].find({"submitted": {"$gte": since}}, projection = {"_id": False}):
+            if entry["date"]:
+                entry["date"] = entry["date"].replace(tzinfo = timezone.utc)
+            self.index.add(int(entry["hash"], 16), entry)
+        return self
+
+    def find(self, img_hash):
+        return self.index.find(img_hash)
+
+    async def add(self, img_hash, member_id, img_date):
+        entry = {
+            "hash": "{:064x}".format(img_hash),
+            "member_id": member_id,
+            "date": img_date,
+            "submitted": dtime.now(tz = timezone.utc)
+        }
+        self.index.add(img_hash, dict(entry))
+        await db["verification_images"].insert_one(entry)
+
+verification_images = VerificationImages()
+
+@startup.stage("verification_images", after = ("database",))
+async def load_verification_images():
+    return await verification_images.load()
+
+async def check_membership_image(member_id, img_url):
+    # read the billing date from a membership screenshot, reusing the result of a near-identical
+    # screenshot the same member already sent while its billing date is still upcoming
+    # returns (billing date or None, [(distance, entry)] of other members who sent the same screenshot)
+    images = await startup.wait("verification_images")
+    img = await client.loop.run_in_executor(None, _download_image, img_url)
+    img_hash = await client.loop.run_in_executor(None, dhash, img)
+    matches = images.find(img_hash)
+
+    def reused_by_others(img_date):
+        # screenshots of the same page can look alike, so other members are flagged
+        # only for an identical hash or the same billing date
+        return [
+            (distance, entry) for distance, entry in matches
+            if entry["member_id"] != member_id and (distance == 0 or (img_date and entry["date"] == img_date))
+        ]
+
+    now = dtime.now(tz = timezone.utc)
+    for distance, entry in matches:
+        if entry["member_id"] == member_id and entry["date"] and entry["date"] > now:
+            return entry["date"], reused_by_others(entry["date"])
+
+    img_date = await _detect_image_date(img)
+    # a retried job sees its own screenshot again, don't store it twice
+    if not any(distance == 0 and entry["member_id"] == member_id for distance, entry in matches):
+        await images.add(img_hash, member_id, img_date)
+    return img_date, reused_by_others(img_date)
+
+"""verification job document in db["verification_jobs"]
+{
+    "member_id": int
+    "img_url": str
+    "status": "pending" | "processing" | "done" | "failed"
+    "attempts": int
+    "created": datetime
+    "updated": datetime
+    "not_before": datetime (not claimed again before this time)
+    "error": str (only if the last attempt failed)
+    "steps": {"membership": bool, "posted": bool, "role": bool, "dm": bool} (steps already done)
+    "membership_date": datetime (once the membership step is done)
+    "reused": [{"member_id": int, "submitted": datetime, "distance": int}] (once the membership step is done)
+    "in_guild": bool (once the role step is done)
+    "dm_failed": bool (set if the member couldn't be DMed)
+}
+"""
+class VerificationQueue:
+    # durable queue of verify requests, processed by a fixed number of workers
+    # jobs are claimed atomically, and jobs left processing by a restart are put back to pending
+    # each step of a job is recorded on it when done, so a retried job only redoes the steps that failed
+
+    def __init__(self, workers = 2, max_attempts = 3, retry_delay = 60):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.wakeup = asyncio.Event()
+
+    async def put(self, member_id, img_url):
+        now = dtime.now(tz = timezone.utc)
+        await db["verification_jobs"].insert_one({
+            "member_id": member_id,
+            "img_url": img_url,
+            "status": "pending",
+            "attempts": 0,
+            "created": now,
+            "updated": now,
+            "not_before": now,
+            "steps": {}
+        })
+        self.wakeup.set()
+
+    async def pending_count(self):
+        return await db["verification_jobs"].count_documents({"status": {"$in": ["pending", "processing"]}})
+
+    async def _claim(self):
+        # oldest pending job that is due, marked as processing so no other worker takes it
+        now = dtime.now(tz = timezone.utc)
+        return await db["verification_jobs"].find_one_and_update(
+            {"status": "pending", "not_before": {"$not": {"$gt": now}}},
+            {"$set": {"status": "processing", "updated": now}, "$inc": {"attempts": 1}},
+            sort = [("created", pymongo.ASCENDING)],
+            return_document = ReturnDocument.AFTER
+        )
+
+    async def _finish(self, job, status, error = None, delay = 0):
+        now = dtime.now(tz = timezone.utc)
+        fields = {"status": status, "updated": now, "not_before": now + timedelta(seconds = delay)}
+        if error:
+            fields["error"] = error
+        await db["verification_jobs"].update_one({"_id": job["_id"]}, {"$set": fields})
+
+    async def _next_job(self):
+        # claims and processes one job, returns False if there was none
+        job = await self._claim()
+        if not job:
+            return False
+        try:
+            await process_verification(job)
+        except Exception as e:
+            print("Verification job for {} failed: {!r}".format(job["member_id"], e))
+            if job["attempts"] < self.max_attempts:
+                # back off a bit more after every failed attempt
+                await self._finish(job, "pending", repr(e), delay = self.retry_delay * 2 ** (job["attempts"] - 1))
+            else:
+                await self._finish(job, "failed", repr(e))
+                await verification_failed(job)
+        else:
+            await self._finish(job, "done")
+        return True
+
+    async def _worker(self):
+        while True:
+            # clear before claiming, so a job put in between still wakes a worker up
+            self.wakeup.clear()
+            try:
+                if await self._next_job():
+                    continue
+            except Exception as e:
+                # database errors must not stop the worker, a job left processing is resumed on restart
+                print("Verification worker error: {!r}".format(e))
+            # jobs waiting for a retry are due at most retry_delay later
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout = self.retry_delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        await startup.wait("database")
+        await db["verification_jobs"].create_index([("status", pymongo.ASCENDING), ("created", pymongo.ASCENDING)])
+        # jobs that were being processed when the bot stopped start over
+        resumed = await db["verification_jobs"].update_many({"status": "processing"}, {"$set": {"status": "pending"}})
+        if resumed.modified_count:
+            print("Resuming {} verification jobs".format(resumed.modified_count))
+        await asyncio.gather(*(self._worker() for i in range(self.workers)))
+
+verification_queue = VerificationQueue(workers = verify_workers)
+
+## Welcome tools
+welcome_message = "Paao~! Welcome to Shishiro Botan's Den, {}!\nPlease be sure to read the rules in {} and support our lion goddess Botan. ☀️"
+
+async def welcome_member(member):
+    ## get data for welcome message
+    wc_ch = client.get_channel(d["discord_ids"]["welcome"])
+    r_ch = client.get_channel(d["discord_ids"]["rules"])
+    member_count  = member.guild.member_count
+    m = welcome_message.format(member.mention, r_ch.mention)
+
+    ## get avatar, then render the welcome card in the process pool
+    engine = await startup.wait("render_engine")
+    image_data = None
+    try:
+        avatar = await avatar_cache.get(member, 250)
+        image_data = await engine.render(render_welcome, avatar, str(member), member_count)
+    except (RenderQueueFull, asyncio.TimeoutError):
+        pass
+    except Exception as e:
+        print("Welcome card for {} failed: {!r}".format(member.id, e))
+
+    try:
+        if image_data:
+            await wc_ch.send(m, file = discord.File(io.BytesIO(image_data), filename = "welcome.png"))
+        else:
+            # still welcome the member, just without the card
+            await wc_ch.send(m)
+    finally:
+        ## send member's join info to mods logs
+        server_logs_ch = client.get_channel(d["discord_ids"]["server_log"])
+
+        m = "{} {}".format(member.mention, str(member))
+
+        embed = discord.Embed(title = "Member Joined", description = m, colour = 0xE2FAB5)
+        embed.set_thumbnail(url = member.avatar_url)
+        embed.add_field(name = "Account Creation Date", value = member.created_at, inline = False)
+        embed.set_footer(text = "ID: {}".format(member.id))
+
+        await server_logs_ch.send(content = None, embed = embed)
+
+async def welcome_batch(members):
+    # one welcome message and one digest log embed for a batch of members joining during a raid
+    wc_ch = client.get_channel(d["discord_ids"]["welcome"])
+    r_ch = client.get_channel(d["discord_ids"]["rules"])
+    mentions = ", ".join(member.mention for member in members)
+    await wc_ch.send(welcome_message.format(mentions, r_ch.mention))
+
+    server_logs_ch = client.get_channel(d["discord_ids"]["server_log"])
+    lines = ["{} {} (created {})".format(member.mention, str(member), member.created_at.strftime("%Y-%m-%d")) for member in members]
+    ## keep the description under discord's 2048 character limit
+    description = ""
+    for i, line in enumerate(lines):
+        if len(description) + len(line) > 1900:
+            description += "... and {} more".format(len(lines) - i)
+            break
+        description += line + "\n"
+
+    embed = discord.Embed(title = "Members Joined (raid mode)", description = description, colour = 0xE2FAB5)
+    embed.set_footer(text = "{} members | Member count: {}".format(len(members), members[-1].guild.member_count))
+    await server_logs_ch.send(content = None, embed = embed)
+
+class WelcomeQueue:
+    # welcomes new members with a bounded number of concurrent workers
+    # joins are counted over a sliding window, at raid_threshold joins the queue switches to raid mode:
+    # members are batched into one welcome message and one log digest instead of a card each,
+    # until the join rate drops back under the threshold
+
+    def __init__(self, concurrency = 4, raid_threshold = 10, window = 10, batch_size = 25, batch_delay = 5):
+        self.queue = asyncio.Queue()
+        self.concurrency = concurrency
+        self.raid_threshold = raid_threshold
+        self.window = window
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.joins = deque()
+        self.batch = []
+        self.raid_mode = False
+
+    def _recent_joins(self):
+        # drop join times that fell out of the window, returns the number left
+        now = client.loop.time()
+        while self.joins and now - self.joins[0] > self.window:
+            self.joins.popleft()
+        return len(self.joins)
+
+    def put(self, member):
+        self.joins.append(client.loop.time())
+        if not self.raid_mode and self._recent_joins() >= self.raid_threshold:
+            self.raid_mode = True
+            print("Welcome queue: raid mode on ({} joins in {}s)".format(len(self.joins), self.window))
+        self.queue.put_nowait(member)
+
+    async def _flush(self):
+        members, self.batch = self.batch, []
+        if members:
+            await welcome_batch(members)
+
+    async def _worker(self):
+        while True:
+            member = await self.queue.get()
+            try:
+                # members still queued when a raid starts get batched as well
+                if self.raid_mode:
+                    self.batch.append(member)
+                    if len(self.batch) >= self.batch_size:
+                        await self._flush()
+                else:
+                    await welcome_member(member)
+            except Exception as e:
+                print("Welcome queue: failed to welcome {}: {!r}".format(member.id, e))
+            finally:
+                self.queue.task_done()
+
+    async def _batcher(self):
+        # flush partial batches regularly, and leave raid mode once the burst is over
+        while True:
+            await asyncio.sleep(self.batch_delay)
+            try:
+                await self._flush()
+            except Exception as e:
+                print("Welcome queue: failed to send batch: {!r}".format(e))
+            if self.raid_mode and self._recent_joins() < self.raid_threshold and self.queue.empty():
+                self.raid_mode = False
+                print("Welcome queue: raid mode off")
+
+    async def run(self):
+        workers = [self._worker() for i in range(self.concurrency)]
+        await asyncio.gather(self._batcher(), *workers)
+
+welcome_queue = WelcomeQueue(concurrency = welcome_concurrency, raid_threshold = raid_threshold, window = raid_window)
 
 # Main Events
 
@@ -444,7 +1152,7 @@ async def help_command(res, msg):
 
 ### command message commands
 async def greet(res, msg):
-    nickname = booster_nickname(res.mentions[0] if msg else res.author)
+    nickname = await booster_nickname(res.mentions[0] if msg else res.author)
     m = "La Lion~! La Lioon~! Nene ni Gao Gao~ La Lion~!\nOhayou-gozaimasu, {}.".format(nickname)
     await res.channel.send(m)
 
@@ -466,18 +1174,20 @@ async def score_me(res, msg):
     await edit_msg.edit(content = "[RESTRICTED]")
 
 async def sleepy(res, msg):
+    counter = await startup.wait("counter")
     counter["sleepy"] += 1
     sleep_count = counter["sleepy"]
     await res.channel.send("<:BotanSleepy:742049916117057656>")
     await res.channel.send("{} Sleepy Bodans sleeping on the floor.".format(sleep_count))
-    db["settings"].update_one({"name": "counter"}, {"$set": {"sleepy": counter["sleepy"]}})
+    await db["settings"].update_one({"name": "counter"}, {"$set": {"sleepy": counter["sleepy"]}})
 
 async def shishilamy(res, msg):
+    counter = await startup.wait("counter")
     counter["shishilamy"] += 1
     sl_count = counter["shishilamy"]
     await res.channel.send("<:BotanLamyNY1:798476668733358110><:BotanLamyNY2:798476692795817994>")
     await res.channel.send("{} Bodans on the ShishiLamy Teetee ship!".format(sl_count))
-    db["settings"].update_one({"name": "counter"}, {"$set": {"shishilamy": counter["shishilamy"]}})
+    await db["settings"].update_one({"name": "counter"}, {"$set": {"shishilamy": counter["shishilamy"]}})
 
 async def poi(res, msg):
     botan_nades = [
@@ -507,7 +1217,7 @@ async def random_choice(res, msg):
     # returns if msg is empty
     if not msg:
         m = "Sorry {}, your argument needs to be at least one choice!"
-        await res.channel.send(m.format(booster_nickname(res.author)))
+        await res.channel.send(m.format(await booster_nickname(res.author)))
         return
     
     # splits msg according to commas and new lines, and strip extra spaces
@@ -527,6 +1237,7 @@ async def birthday(res, msg):
 
 async def botan_trivia(res, msg):
     # pop a trivia from temp
+    await startup.wait("trivia")
     trivia = temp_trivia_deque.popleft()
     temp_trivia_set.remove(trivia["id"])
     embed = discord.Embed(title = "Do You Know?", description = trivia["desc"], colour = embed_color)
@@ -534,9 +1245,9 @@ async def botan_trivia(res, msg):
     await res.channel.send(content = None, embed = embed)
 
     # get a new trivia from database to add to temp
-    new_trivia = list(db["trivia"].aggregate([{"$sample": {"size": 1}}]))[0]
+    new_trivia = (await db["trivia"].aggregate([{"$sample": {"size": 1}}]))[0]
     while new_trivia["id"] in temp_trivia_set:
-        new_trivia = list(db["trivia"].aggregate([{"$sample": {"size": 1}}]))[0]
+        new_trivia = (await db["trivia"].aggregate([{"$sample": {"size": 1}}]))[0]
     temp_trivia_set.add(new_trivia["id"])
     temp_trivia_deque.append(new_trivia)
 
@@ -549,8 +1260,10 @@ async def botan_trivia(res, msg):
     "scheduled_start_time"
     "actual_start_time"
     "actual_end_time"
-    "tag_count": 1
-    "tags": {
+    "tag_count": 1 (tags are stored in db["stream_tags"], see streams.py)
+    "archive_link_msg": id of the video link message in the archive channel
+    "archive_msgs": [{"id": message id, "hash": content hash of the embed page}, ...]
+    "tags": { (legacy, streams tagged before stream_tags)
         "0": {
             "author_id": author's id,
             "timestamp": datetime,
@@ -560,6 +1273,17 @@ async def botan_trivia(res, msg):
         ...
     }
 """
+## live stream id, cached for a few seconds so a burst of tags doesn't query the database for every tag
+live_stream_cache = {"vid_id": None, "checked": None}
+
+async def current_live_stream():
+    now = client.loop.time()
+    if live_stream_cache["checked"] is None or now - live_stream_cache["checked"] > 10:
+        vid_data = await stream_repo.first_by_status(("live",), ("id",))
+        live_stream_cache["vid_id"] = vid_data["id"] if vid_data else None
+        live_stream_cache["checked"] = now
+    return live_stream_cache["vid_id"]
+
 async def vid_tag(res, msg):
     # check if channel is live stream channel
     if res.channel.id != d["discord_ids"]["live_stream"]:
@@ -567,8 +1291,8 @@ async def vid_tag(res, msg):
         return
 
     # check if there is a livestream
-    vid_data = db["streams"].find_one({"status": "live"})
-    if not vid_data:
+    vid_id = await current_live_stream()
+    if not vid_id:
         await res.channel.send("There are no ongoing live streams now!")
         return
     
@@ -578,27 +1302,13 @@ async def vid_tag(res, msg):
         return
     
     # return if too many characters
-    chr_limit = 400 if is_booster(res.author) else 200
+    chr_limit = 400 if await is_booster(res.author) else 200
     if len(msg) > chr_limit:
         await res.channel.send("You have exceeded your character limit of {}! Please shorten your message.".format(chr_limit))
-        
-    # check if tags exist in vid data, if not, create it
-    if not vid_data.get("tags"):
-        vid_data["tags"] = {}
-        vid_data["tag_count"] = 0
-
-    # insert text, timestamp and author's id
-    vid_data["tags"][str(vid_data["tag_count"])] = {
-        "author_id": res.author.id,
-        "timestamp": dtime.now(tz = timezone.utc),
-        "text": msg
-    }
-
-    # increment tag count
-    vid_data["tag_count"] += 1
+        return
 
-    # update data
-    db["streams"].update_one({"id": vid_data["id"]}, {"$set": {"tags": vid_data["tags"], "tag_count": vid_data["tag_count"]}})
+    # buffer text, timestamp and author's id, the buffer writes tags to the database in bulk
+    tag_buffer.add(vid_id, res.author.id, msg, dtime.now(tz = timezone.utc))
 
     # add reaction to acknowledge tag
     await res.add_reaction("\U0001F4AF")
@@ -614,22 +1324,14 @@ async def subscribers(res, msg):
         vtuber_name = msg.capitalize()
 
     # Look for channel
-    request = youtube.channels().list(
-        part = "statistics",
-        id = ch_id
-    )
-    yt_stats = request.execute()["items"][0]["statistics"]
+    youtube = await startup.wait("youtube")
+    yt_stats = (await youtube.channels([ch_id], "statistics"))[ch_id]["statistics"]
     m = "{} currently has {:,} subscribers and a total of {:,} views on her YouTube channel."
     await res.channel.send(m.format(vtuber_name, int(yt_stats["subscriberCount"]), int(yt_stats["viewCount"])))
 
 async def live_streams(res, msg):
     # Look for live streams (only return one)
-    live_vid = db["streams"].find_one({
-        "$or": [
-            {"status": "justlive"},
-            {"status": "live"}
-        ]
-    })
+    live_vid = await stream_repo.first_by_status(("justlive", "live"), ("id",))
     if live_vid:
         vid_id = live_vid["id"]
         vid_url = "https://www.youtube.com/watch?v=" + vid_id
@@ -641,7 +1343,7 @@ async def live_streams(res, msg):
         return
     
     # Look for upcoming streams if there's no live streams
-    upcoming_vids = db["streams"].find({"status": "upcoming"})
+    upcoming_vids = await stream_repo.by_status(("upcoming",), ("id", "scheduled_start_time"))
     
     flag = False
 
@@ -665,7 +1367,7 @@ async def translate(res, msg):
     if not msg:
         await res.channel.send("But there's nothing to translate!")
         return
-    translated = to_eng(msg).text
+    translated = (await to_eng(msg)).text
     embed = discord.Embed(title = "Translated to English", description = translated, colour = embed_color)
     await res.channel.send(content = None, embed = embed)
 
@@ -673,7 +1375,7 @@ async def trans_to_jap(res, msg):
     if not msg:
         await res.channel.send("Try again, but with actual words!")
         return
-    translated = to_jap(msg)
+    translated = await to_jap(msg)
     pronunciation = translated.pronunciation
     if not isinstance(pronunciation, str):
         pronunciation = ""
@@ -747,76 +1449,20 @@ async def superchat(res, msg):
     amount = format_string
     msg = to_raw_text("\n".join(msg_args))
 
-    # get avatar and resize 
-    avatar_url = res.author.avatar_url
-    av_img = Image.open(requests.get(avatar_url, stream=True).raw)
-    av_img = av_img.resize((83, 83))
-
-    # draw a mask to crop the ellipse
-    mask_im = Image.new("L", (83, 83), 0)
-    draw = ImageDraw.Draw(mask_im)
-    draw.ellipse((0, 0, 83, 83), fill=255)
-
-    # open background sc, and paste in the avatar and the cropping mask
-    back_im = Image.open(os.path.join(img_dir, sc_file_name)).copy()
-    back_im.paste(av_img, (15, 15), mask_im)
-
-    # add fonts
-    idraw = ImageDraw.Draw(back_im)
-    name_font_ttf = os.path.join(fonts_dir, "Roboto-Light.ttf")
-    name_font = ImageFont.truetype(name_font_ttf, size = 40)
-
-    amount_font_ttf = os.path.join(fonts_dir, "Roboto-Black.ttf")
-    amount_font = ImageFont.truetype(amount_font_ttf, size = 40)
-
-    text_font_ttf = os.path.join(fonts_dir, "Roboto-Regular.ttf")
-    text_font = ImageFont.truetype(text_font_ttf, size = 40)
-
-    # write name to img
-    nickname = res.author.display_name
-    idraw.text(
-        (118, 13),
-        nickname,
-        font = name_font,
-        fill = fill
-    )
-
-    # write amount to img
-    idraw.text(
-        (118, 61),
-        amount,
-        font = amount_font,
-        fill = fill
-    )
-
-    # write text to img
-    if msg:
-        wraplength = 660
-
-        m, *words = msg.split(" ")
-        ## wrap text if longer than wraplength
-        for word in words:
-            if idraw.textsize(m + " " + word, text_font)[0] > wraplength:
-                m += "\n" + word
-            else:
-                m += " " + word
-        txt_w, txt_h = idraw.textsize(m, text_font)
-        idraw.text(
-            (15, 129), 
-            m, 
-            font = text_font, 
-            fill = fill
-        )
-
-    # crop img of excessive length
-    final_height = (txt_h + 144) if msg else 114
-    back_im = back_im.crop((0, 0, 690, final_height))
-
-    # save image
-    save_file = os.path.join(save_dir, str(random.randint(1,20)) + sc_file_name)
-    back_im.save(save_file)
+    # get avatar, then render in the process pool
+    engine = await startup.wait("render_engine")
+    try:
+        avatar = await avatar_cache.get(res.author, 83)
+        image_data = await engine.render(render_superchat, avatar, sc_file_name, fill, res.author.display_name, amount, msg)
+    except (RenderQueueFull, asyncio.TimeoutError):
+        await res.channel.send("Botan is too busy drawing superchats right now! Try again in a bit.")
+        return
+    except Exception as e:
+        print("Superchat render failed: {!r}".format(e))
+        await res.channel.send("I'm sorry! Botan couldn't draw the superchat!\nTry again later!")
+        return
 
-    await res.channel.send(file = discord.File(save_file))
+    await res.channel.send(file = discord.File(io.BytesIO(image_data), filename = "superchat.png"))
 
 async def meme(res, msg):
     err_msg = "Please provide a correct meme argument!! (ex: $meme woke)"
@@ -835,80 +1481,59 @@ async def meme(res, msg):
     meme_info = d["meme"][meme_cmd]
     file_name = meme_info["file"]
     positions = meme_info["positions"]
-    wrapsize = meme_info["wrapsize"]
-    text_align = meme_info["align"]
-    meme_font = meme_info["font"]
 
     if len(meme_args) < len(positions):
         await res.channel.send("You need {} more arguments!".format(len(positions)-len(meme_args)))
         return
-    
-    meme_file = os.path.join(img_dir, file_name)
-    save_file = os.path.join(save_dir, str(random.randint(1,20)) + file_name)
 
+    # remove emotes, change all others mentions to raw text
+    texts = [to_raw_text(arg) for arg in meme_args[:len(positions)]]
+
+    engine = await startup.wait("render_engine")
     try:
-        img = Image.open(meme_file)
+        image_data = await engine.render(render_meme, meme_info, texts)
     except IOError:
         await res.channel.send("I'm sorry! Botan can't find the meme now!\nTry again later!")
         return
-    
-    width, height = img.size
-    wraplength = wrapsize * width
-
-    idraw = ImageDraw.Draw(img)
-    font_ttf = os.path.join(fonts_dir, meme_font["name"])
-    font = ImageFont.truetype(font_ttf, size = meme_font["size"])
-
-    for pos, arg in zip(positions, meme_args):
-        # remove emotes, change all others mentions to raw text
-        arg = to_raw_text(arg)
-
-        m, *words = arg.split(" ")
-        # wrap text if longer than wraplength
-        for word in words:
-            if idraw.textsize(m + " " + word, font)[0] > wraplength:
-                m += "\n" + word
-            else:
-                m += " " + word
-        txt_w, txt_h = idraw.textsize(m, font)
-        idraw.text(
-            (width*pos[0]-txt_w/2, height*pos[1]-txt_h/2), 
-            m, 
-            font = font, 
-            fill = tuple(meme_font["fill"]),
-            align = text_align
-        )
-    img.save(save_file)
-    await res.channel.send(file = discord.File(save_file))
+    except (RenderQueueFull, asyncio.TimeoutError):
+        await res.channel.send("Botan is too busy drawing memes right now! Try again in a bit.")
+        return
+    except Exception as e:
+        print("Meme render failed: {!r}".format(e))
+        await res.channel.send("I'm sorry! Botan couldn't draw the meme!\nTry again later!")
+        return
+
+    await res.channel.send(file = discord.File(io.BytesIO(image_data), filename = file_name))
 
 async def botan_art(res, msg):
     # pop one  from temp
+    await startup.wait("artworks")
     art_url = temp_art_deque.popleft()
     temp_art_set.remove(art_url)
     await res.channel.send(art_url)
 
     # get a new art url from database to add to temp
-    new_art_url = list(db["artworks"].aggregate([{"$sample": {"size": 1}}]))[0]["url"]
+    new_art_url = (await db["artworks"].aggregate([{"$sample": {"size": 1}}]))[0]["url"]
     while new_art_url in temp_art_set:
-        new_art_url = list(db["artworks"].aggregate([{"$sample": {"size": 1}}]))[0]["url"]
+        new_art_url = (await db["artworks"].aggregate([{"$sample": {"size": 1}}]))[0]["url"]
     temp_art_set.add(new_art_url)
     temp_art_deque.append(new_art_url)
 
 ## !!! Valentines Event
 async def valentines_confession(res, msg):
     # retrieve user form valentines database
-    participant = db["valentines"].find_one({"id": res.author.id})
+    participant = await db["valentines"].find_one({"id": res.author.id})
 
     # if user not in valentines database
     if not participant:
         m = "I'm sorry {}, this command is only available to Valentine's event participant!"
-        await res.channel.send(m.format(booster_nickname(res.author)))
+        await res.channel.send(m.format(await booster_nickname(res.author)))
         return
     
     # if user has already confessed
     if participant.get("already_confessed", None):
         m = "Sorry {}, it seems like you already made a confession! Contact Rachel if you wish to reset."
-        await res.channel.send(m.format(booster_nickname(res.author)))
+        await res.channel.send(m.format(await booster_nickname(res.author)))
         return
     
     confession_channel = client.get_channel(d["discord_ids"]["valentines_confession"])
@@ -920,7 +1545,7 @@ async def valentines_confession(res, msg):
         m += "say in public? Or do you just want to share your feelings about this event or the server in general? "
         m += "Whatever it is, make your confession here! It is completely anonymous. You only get to confess once, so make it count."
         m += "\n``confess {{Message}}``"
-        await res.channel.send(m.format(booster_nickname(res.author)))
+        await res.channel.send(m.format(await booster_nickname(res.author)))
         return
     
     # Show embed of message including photo
@@ -966,11 +1591,11 @@ async def valentines_confession(res, msg):
     await res.channel.send("We have sent your confession to the channel! Please contact Rachel if you need to change anything.")
 
     # update last sent to now in database
-    db["valentines"].update_one({"id": res.author.id}, {"$set": {"already_confessed" : True}})
+    await db["valentines"].update_one({"id": res.author.id}, {"$set": {"already_confessed" : True}})
 
 async def send_valentines_message(res, msg):
     # retrieve user form valentines database
-    participant = db["valentines"].find_one({"id": res.author.id})
+    participant = await db["valentines"].find_one({"id": res.author.id})
 
     # if user not in valentines database
     if not participant:
@@ -978,7 +1603,7 @@ async def send_valentines_message(res, msg):
         m += "\nTo participate in the event, kindly refer to the announcement channel of Botan's fan server or contact a mod."
         m += "\nIf you have already reacted to the Secret Guardian role in the server, please note that it may take a while to match new people."
         m += "\nWe will notify you again upon matching."
-        await res.channel.send(m.format(booster_nickname(res.author)))
+        await res.channel.send(m.format(await booster_nickname(res.author)))
         return
 
     botan_guild = client.get_guild(d["discord_ids"]["guild"])
@@ -987,7 +1612,7 @@ async def send_valentines_message(res, msg):
     if not target:
         m = "I'm sorry {}, I can't find your secret match in the server anymore!"
         m += " It is possible that they may have left the server. Please contact a mod for manual reassignment."
-        await res.channel.send(m.format(booster_nickname(res.author)))
+        await res.channel.send(m.format(await booster_nickname(res.author)))
         return
 
     # if msg is empty
@@ -1008,7 +1633,7 @@ async def send_valentines_message(res, msg):
         # tell the remaining time left till next available send and return
         timeleft_str = time_to_string(*days_hours_minutes(timedelta(hours = 2) - (time_now - last_sent)))
         m = "Sorry {}, you still need to wait for another {} before you can send {} another anonymous letter!"
-        await res.channel.send(m.format(booster_nickname(res.author), timeleft_str, target.name))
+        await res.channel.send(m.format(await booster_nickname(res.author), timeleft_str, target.name))
         return
 
     # Show embed of message including photo
@@ -1054,7 +1679,7 @@ async def send_valentines_message(res, msg):
     await res.channel.send("We have sent your letter to {}! You may send a new one after 2 hours.".format(target.name))
 
     # update last sent to now in database
-    db["valentines"].update_one({"id": res.author.id}, {"$set": {"last_sent" : time_now}})
+    await db["valentines"].update_one({"id": res.author.id}, {"$set": {"last_sent" : time_now}})
 
 async def push_new_valentines_batch(res, msg):
     botan_guild = client.get_guild(d["discord_ids"]["guild"])
@@ -1062,7 +1687,8 @@ async def push_new_valentines_batch(res, msg):
 
     # get new participants with unassigned match
     all_participants = set(member.id for member in guardian_role.members)
-    existing_participants = set(member["id"] for member in db["valentines"].find({}, projection = {"id": True, "_id": False}))
+    existing_data = await db["valentines"].find({}, projection = {"id": True, "_id": False})
+    existing_participants = set(member["id"] for member in existing_data)
     new_participants = list(all_participants - existing_participants)
     random.shuffle(new_participants)
 
@@ -1083,7 +1709,7 @@ async def push_new_valentines_batch(res, msg):
             "guardian": new_participants[i-1],
             "target": new_participants[(i+1)%len(new_participants)]
         }
-        db["valentines"].insert_one(new_participant)
+        await db["valentines"].insert_one(new_participant)
 
         # send new participant instructions
         participant = client.get_user(new_participant["id"])
@@ -1093,7 +1719,7 @@ async def push_new_valentines_batch(res, msg):
             print(new_participant)
             continue
 
-        msg = "".join(m).format(booster_nickname(participant), str(target))
+        msg = "".join(m).format(await booster_nickname(participant), str(target))
         embed = discord.Embed(title = title, description = msg, colour = embed_color)
         embed.set_thumbnail(url = target.avatar_url)
         await participant.send(content = None, embed = embed)
@@ -1107,7 +1733,7 @@ async def remove_valentines_inactive(res, msg):
 # temp valentines mass dm command
 async def valentines_dm(res, msg):
     # retrieve db participants
-    participants = db["valentines"].find()
+    participants = await db["valentines"].find()
 
     # craft message content
     m = [
@@ -1129,7 +1755,7 @@ async def valentines_dm(res, msg):
             print(participant_data)
             continue
 
-        msg = "".join(m).format(booster_nickname(participant), str(target))
+        msg = "".join(m).format(await booster_nickname(participant), str(target))
         embed = discord.Embed(title = title, description = msg, colour = embed_color)
         embed.set_thumbnail(url = target.avatar_url)
         await participant.send(content = None, embed = embed)
@@ -1149,6 +1775,15 @@ async def valentines_dm(res, msg):
     }
 }
 """
+### in-memory index of role reactions: {msg_id: {emoji_str: role_id}}
+reaction_roles = {}
+
+@startup.stage("reactions", after = ("database",))
+async def load_reaction_roles():
+    for reaction_data in await db["reactions"].find():
+        reaction_roles[reaction_data["msg_id"]] = dict(reaction_data["reactions"])
+    return reaction_roles
+
 ### add role reaction to existing message
 async def new_role_reaction(res, msg):
     if (not res.author.guild_permissions.administrator) and str(res.author) != owner:
@@ -1195,7 +1830,7 @@ async def new_role_reaction(res, msg):
         return
     
     # store role reaction to database
-    reaction_data = db["reactions"].find_one({"msg_id": msg_id})
+    reaction_data = await db["reactions"].find_one({"msg_id": msg_id})
 
     # if reaction data doesn't exist, create data
     if not reaction_data:
@@ -1206,14 +1841,18 @@ async def new_role_reaction(res, msg):
                 emoji_str: role_id
             }
         }
-        db["reactions"].insert_one(reaction_data)
+        await db["reactions"].insert_one(reaction_data)
     elif reaction_data["reactions"].get(emoji_str, None):
         # if reaction role already exists, return error
         await res.channel.send("Reaction role already exists, please try another emote or message.")
         return
     else:
         # else update data
-        db["reactions"].update_one(reaction_data, {"$set": {"reactions.{}".format(emoji_str): role_id}})
+        await db["reactions"].update_one(reaction_data, {"$set": {"reactions.{}".format(emoji_str): role_id}})
+
+    # keep index in sync
+    await startup.wait("reactions")
+    reaction_roles.setdefault(msg_id, {})[emoji_str] = role_id
     
     await res.channel.send("Successfully added reaction role!")
 
@@ -1239,16 +1878,22 @@ async def remove_role_reaction(res, msg):
         return
     
     # find database with msg_id and emoji_str
-    reaction_data = db["reactions"].find_one({"msg_id": msg_id})
+    reaction_data = await db["reactions"].find_one({"msg_id": msg_id})
     if (not reaction_data) or (not reaction_data["reactions"].get(emoji_str, None)):
         await res.channel.send("This reaction role doesn't exist in database! Please check your arguments.")
         return
     
     # if more than one reaction in reaction data, update field, else remove document
     if len(reaction_data["reactions"]) > 1:
-        db["reactions"].update_one({"msg_id": msg_id}, {"$unset": {"reactions.{}".format(emoji_str): None}})
+        await db["reactions"].update_one({"msg_id": msg_id}, {"$unset": {"reactions.{}".format(emoji_str): None}})
     else:
-        db["reactions"].delete_one(reaction_data)
+        await db["reactions"].delete_one(reaction_data)
+
+    # keep index in sync
+    await startup.wait("reactions")
+    reaction_roles.get(msg_id, {}).pop(emoji_str, None)
+    if not reaction_roles.get(msg_id, True):
+        del reaction_roles[msg_id]
     
     # if message still exists in channel with the bot reaction, remove it.
     ch_id = reaction_data.get("ch_id", None)
@@ -1280,6 +1925,32 @@ async def get_bans(res, msg):
             m = entry_str
     await res.channel.send(m)
 
+### reload banned links from data/blacklist.json without restarting
+async def reload_blacklist(res, msg):
+    global ban_matcher
+    f_path = os.path.join(data_dir, "blacklist.json")
+    try:
+        new_matcher = await client.loop.run_in_executor(None, PatternMatcher.from_blacklist, f_path)
+    except (IOError, ValueError, KeyError):
+        await res.channel.send("Failed to read the blacklist file, keeping the current list.")
+        return
+    ban_matcher = new_matcher
+    d["blacklist"]["ban_links"] = list(new_matcher.patterns)
+    await res.channel.send("Blacklist reloaded with {} banned links.".format(len(new_matcher)))
+
+### render engine metrics
+async def render_stats(res, msg):
+    engine = await startup.wait("render_engine")
+    stats = engine.stats()
+    m = "\n".join("{}: {}".format(key, round(value, 3) if isinstance(value, float) else value) for key, value in sorted(stats.items()))
+    await res.channel.send("```\n{}\n```".format(m))
+
+async def ocr_stats(res, msg):
+    ocr_pool = await startup.wait("ocr")
+    stats = ocr_pool.stats()
+    m = "\n".join("{}: {}".format(key, round(value, 3) if isinstance(value, float) else value) for key, value in sorted(stats.items()))
+    await res.channel.send("```\n{}\n```".format(m))
+
 ### get members count based on role
 async def get_members_count(res, msg):
     if not is_integer(msg):
@@ -1323,8 +1994,7 @@ async def read(res, msg):
     messages = await res.channel.history(limit = 2).flatten()
     for m in messages:
         for embed in m.embeds:
-            embed.title = to_eng(embed.title).text
-            embed.description = to_eng(embed.description).text
+            await translate_embed(embed)
             await channel.send(content = None, embed = embed)
 
 ### detect image text and log two texts (normal and inverted img)
@@ -1341,37 +2011,38 @@ async def detect_image_text(res, msg):
 
 ### database manipulation
 async def add_trivia(res, msg):
+    counter = await startup.wait("counter")
     counter["trivia"] += 1
-    db["trivia"].insert_one({"id": counter["trivia"], "desc": msg})
-    db["settings"].update_one({"name": "counter"}, {"$set": {"trivia": counter["trivia"]}})
+    await db["trivia"].insert_one({"id": counter["trivia"], "desc": msg})
+    await db["settings"].update_one({"name": "counter"}, {"$set": {"trivia": counter["trivia"]}})
     await res.channel.send("Added one new trivia to database with an id of {}.".format(counter["trivia"]))
 
 async def del_trivia(res, msg):
     if not msg or not msg.isdigit():
         await res.channel.send("Please provide the trivia id that you wish to delete!")
         return
-    target_trivia = db["trivia"].find_one({"id": int(msg)})
+    target_trivia = await db["trivia"].find_one({"id": int(msg)})
     if not target_trivia:
         await res.channel.send("Can't find anything similar in the database!")
         return
     await res.channel.send("Found trivia, deleting...")
-    db["trivia"].delete_one(target_trivia)
+    await db["trivia"].delete_one(target_trivia)
     await res.channel.send("Trivia successfully deleted.")
 
 async def add_art(res, msg):
-    if db["artworks"].find_one({"url": msg}):
+    if await db["artworks"].find_one({"url": msg}):
         await res.channel.send("There's already an existing art with the same url!")
         return
-    db["artworks"].insert_one({"url": msg})
+    await db["artworks"].insert_one({"url": msg})
     await res.channel.send("Added one new artwork to database!")
 
 async def del_art(res, msg):
-    target_art = db["artworks"].find_one({"url": msg})
+    target_art = await db["artworks"].find_one({"url": msg})
     if not target_art:
         await res.channel.send("Can't find anything similar in the database!")
         return
     await res.channel.send("Found artwork, deleting now!")
-    db["artworks"].delete_one(target_art)
+    await db["artworks"].delete_one(target_art)
     await res.channel.send("Artwork successfully deleted.")
 
 ### Membership (Zoopass)
@@ -1380,7 +2051,7 @@ async def view_membership(res, msg):
     # if msg is empty, show all members
     if not msg:
         m = ""
-        for bodan in db["bodans"].find():
+        for bodan in await db["bodans"].find():
             member_id = bodan["id"]
             membership_date = bodan["last_membership"].replace(tzinfo = timezone.utc).strftime("%d/%m/%Y")
             new_line = "{}: {}\n".format(member_id, membership_date)
@@ -1402,7 +2073,7 @@ async def view_membership(res, msg):
     member_id = int(member_id)
 
     # Check if zoopass in database and delete
-    target_membership = db["bodans"].find_one({"id": member_id})
+    target_membership = await db["bodans"].find_one({"id": member_id})
     if not target_membership:
         await res.channel.send("Can't find membership id in the database!")
         return
@@ -1440,7 +2111,7 @@ async def set_membership(res, msg):
     member_id = int(member_id)
     
     # Check if id exists
-    target_membership = db["bodans"].find_one({"id": member_id})
+    target_membership = await db["bodans"].find_one({"id": member_id})
     if not target_membership:
         await res.channel.send("Can't find membership id in the database!")
         return
@@ -1454,7 +2125,8 @@ async def set_membership(res, msg):
             await res.channel.send("Please provide a valid date (dd/mm/yyyy) or integer days (+/- integer).")
             return
         new_date = dtime(year = int(dates[2]), month = int(dates[1]), day = int(dates[0]), tzinfo = timezone.utc)
-    db["bodans"].update_one({"id": member_id}, {"$set": {"last_membership": new_date}})
+    await db["bodans"].update_one({"id": member_id}, {"$set": {"last_membership": new_date}})
+    membership_expiry.schedule(member_id, new_date)
 
     await res.channel.send("New membership date for {} set at {}!".format(member_id, new_date.strftime("%d/%m/%Y, %H:%M:%S")))
     
@@ -1470,12 +2142,13 @@ async def del_membership(res, msg):
     member_id = int(member_id)
 
     # Check if zoopass in database and delete
-    target_membership = db["bodans"].find_one({"id": member_id})
+    target_membership = await db["bodans"].find_one({"id": member_id})
     if not target_membership:
         await res.channel.send("Can't find membership id in the database!")
         return
     await res.channel.send("Found membership in database, deleting now!")
-    db["bodans"].delete_one(target_membership)
+    await db["bodans"].delete_one(target_membership)
+    membership_expiry.cancel(member_id)
 
     # Remove zoopass role from user
     botan_guild = client.get_guild(d["discord_ids"]["guild"])
@@ -1498,15 +2171,15 @@ async def add_upcoming_stream(res, msg):
     if not vid_id:
         return
     # check if vid already exists in database
-    if db["streams"].find_one({"id": vid_id}):
+    if await stream_repo.exists(vid_id):
         await res.channel.send("{} already exists in database!".format(vid_id))
         return
     # else store video's id, status and scheduled start time
-    vid_req = youtube.videos().list(
-        part = "snippet,liveStreamingDetails",
-        id = vid_id
-    )
-    vid_res = vid_req.execute()["items"][0]
+    youtube = await startup.wait("youtube")
+    vid_res = (await youtube.videos([vid_id], "snippet,liveStreamingDetails")).get(vid_id)
+    if not vid_res:
+        await res.channel.send("Can't find {} on YouTube!".format(vid_id))
+        return
 
     title = vid_res["snippet"]["title"]
 
@@ -1519,34 +2192,42 @@ async def add_upcoming_stream(res, msg):
         "status": "upcoming",
         "scheduled_start_time": scheduled_start_time
     }
-    db["streams"].insert_one(vid_data)
+    await stream_repo.insert(vid_data)
     await res.channel.send("New upcoming video logged!\n{}\n{}".format(vid_id, scheduled_start_time))
 
 async def end_live_stream(res, msg):
     vid_id = msg
     # Check if stream exists
-    if not db["streams"].find_one({"id": vid_id}):
+    if not await stream_repo.exists(vid_id):
         await res.channel.send("Stream {} does not exist in the database!".format(vid_id))
         return
     
     # Tag stream with ending tag to end it early
-    db["streams"].update_one({"id": vid_id}, {"$set": {
-                    "end": "Stream ended manually at " + str(dtime.now(tz = timezone.utc))
-                }})
+    await stream_repo.update(vid_id, {"end": "Stream ended manually at " + str(dtime.now(tz = timezone.utc))})
     await res.channel.send("Ending stream {} manually!".format(vid_id))
 
 async def delete_stream(res, msg):
     vid_id = msg
-    target_vid = db["streams"].find_one({"id": vid_id})
     # Check if stream exists
-    if not target_vid:
+    if not await stream_repo.exists(vid_id):
         await res.channel.send("Stream {} does not exist in the database!".format(vid_id))
         return
     
     await res.channel.send("Found stream, deleting now!")
-    db["streams"].delete_one(target_vid)
+    await stream_repo.delete(vid_id)
     await res.channel.send("Targeted stream successfully deleted.")
 
+async def youtube_quota(res, msg):
+    # show youtube api units spent per endpoint for the days kept in the ledger
+    youtube = await startup.wait("youtube")
+    m = ""
+    for day in sorted(youtube.ledger, reverse = True):
+        usage = youtube.ledger[day]
+        m += "{}: {} units\n".format(day, sum(usage.values()))
+        m += "".join("    {}: {}\n".format(endpoint, units) for endpoint, units in sorted(usage.items()))
+    m += "\nDaily budget: {} units".format(youtube.budget)
+    await res.channel.send("```\n{}\n```".format(m))
+
 ## booster commands
 """booster's data template
     "id": res.author.id,
@@ -1574,10 +2255,10 @@ async def booster_help(res, msg):
 
 async def new_booster_nickname(res, msg):
     if not msg:
-        await res.channel.send("Your current nickname is {}. If you wish to change it, please provide an argument for the ``nickname`` command!".format(booster_nickname(res.author)))
+        await res.channel.send("Your current nickname is {}. If you wish to change it, please provide an argument for the ``nickname`` command!".format(await booster_nickname(res.author)))
         return
-    db["boosters"].update_one({"id": res.author.id}, {"$set": {"nickname": msg}})
-    await res.channel.send("Noted, I will refer to you as {} from now on.".format(booster_nickname(res.author)))
+    await booster_cache.update(res.author.id, {"nickname": msg})
+    await res.channel.send("Noted, I will refer to you as {} from now on.".format(await booster_nickname(res.author)))
 
 async def new_booster_color_role(res, msg):
     # parse msg into role name and color code
@@ -1597,7 +2278,7 @@ async def new_booster_color_role(res, msg):
         color = discord.Colour(int(color, 16))
 
     # retrieve booster data
-    custom_role_id = db["boosters"].find_one({"id": res.author.id})["custom_role"]
+    custom_role_id = (await is_booster(res.author))["custom_role"]
     botan_guild = client.get_guild(d["discord_ids"]["guild"])
     author = botan_guild.get_member(res.author.id)
 
@@ -1617,7 +2298,7 @@ async def new_booster_color_role(res, msg):
         # update new custom role id
         await author.add_roles(new_custom_role)
         custom_role_id = new_custom_role.id
-        db["boosters"].update_one({"id": res.author.id}, {"$set": {"custom_role": custom_role_id}})
+        await booster_cache.update(res.author.id, {"custom_role": custom_role_id})
         await res.channel.send("New custom role created!")
 
     # if there is an existing color role
@@ -1641,7 +2322,7 @@ async def new_booster_color_role(res, msg):
 
 async def del_booster_color_role(res, msg):
     # retrieve booster data
-    custom_role_id = db["boosters"].find_one({"id": res.author.id})["custom_role"]
+    custom_role_id = (await is_booster(res.author))["custom_role"]
     botan_guild = client.get_guild(d["discord_ids"]["guild"])
 
     if custom_role_id == -1:
@@ -1650,7 +2331,7 @@ async def del_booster_color_role(res, msg):
     
     custom_role = botan_guild.get_role(custom_role_id)
     await custom_role.delete(reason = "{} requested a custom role deletion".format(str(res.author)))
-    db["boosters"].update_one({"id": res.author.id}, {"$set": {"custom_role": -1}})
+    await booster_cache.update(res.author.id, {"custom_role": -1})
     await res.channel.send("Role deletion successful! You may add a custom role again anytime you want.")
 
 ### Removed code of booster news
@@ -1670,71 +2351,142 @@ async def del_booster_color_role(res, msg):
 async def verify_membership(res, msg):
     # Check if there is a valid attachment
     if not res.attachments:
-        await res.channel.send("I'm sorry {}, you need to provide a valid photo along with the ``verify`` command to complete the verification process.".format(booster_nickname(res.author)))
+        await res.channel.send("I'm sorry {}, you need to provide a valid photo along with the ``verify`` command to complete the verification process.".format(await booster_nickname(res.author)))
         return
-    
-    # Get membership time
-    new_membership_date = dtime.now(tz = timezone.utc)
 
-    # if member exists, update date
-    bodan = db["bodans"].find_one({"id": res.author.id})
+    # queue the screenshot and reply right away, the result is sent in a follow-up dm
+    await verification_queue.put(res.author.id, res.attachments[0].url)
+    m = "Verification photo received! I will message you again as soon as it has been processed."
+    queued = await verification_queue.pending_count()
+    if queued > 1:
+        m += " ({} photos in the queue)".format(queued)
+    await res.channel.send(m)
 
-    # check date
-    try:
-        text, inverted_text = await asyncio.wait_for(_detect_image_text(res.attachments[0].url), timeout = 30)
-        img_date = date_from_txt(text) or date_from_txt(inverted_text)
-        if img_date:
-            new_membership_date = img_date - timedelta(days = 30)
-    except asyncio.TimeoutError:
-        print("timeout error detecting image!")
-    except:
-        print("date detection fail!!")
+async def process_verification(job):
+    # run by the verification queue workers
+    # every step is recorded on the job once done and skipped when the job is retried
+    member_id = job["member_id"]
+    steps = job.get("steps", {})
+
+    async def done(step, **fields):
+        steps[step] = True
+        fields["steps.{}".format(step)] = True
+        await db["verification_jobs"].update_one({"_id": job["_id"]}, {"$set": fields})
 
-    if bodan:
-        last_membership = bodan["last_membership"].replace(tzinfo = timezone.utc)
-        db["bodans"].update_one({"id": res.author.id}, {"$set": {"last_membership": max(new_membership_date, last_membership)}})
+    user = client.get_user(member_id) or await client.fetch_user(member_id)
 
-    # if not, create data
+    if steps.get("membership"):
+        new_membership_date = job["membership_date"].replace(tzinfo = timezone.utc)
+        reused = job["reused"]
     else:
-        db["bodans"].insert_one({
-            "id": res.author.id,
-            "last_membership": new_membership_date
-        })
+        # Get membership time
+        new_membership_date = dtime.now(tz = timezone.utc)
+
+        # if member exists, update date
+        bodan = await db["bodans"].find_one({"id": member_id})
+
+        # check date
+        reused = []
+        try:
+            img_date, matches = await asyncio.wait_for(check_membership_image(member_id, job["img_url"]), timeout = 30)
+            if img_date:
+                new_membership_date = img_date - timedelta(days = 30)
+            reused = [
+                {"member_id": entry["member_id"], "submitted": entry["submitted"], "distance": distance}
+                for distance, entry in matches[:5]
+            ]
+        except asyncio.TimeoutError:
+            print("timeout error detecting image!")
+        except:
+            print("date detection fail!!")
+
+        if bodan:
+            last_membership = bodan["last_membership"].replace(tzinfo = timezone.utc)
+            await db["bodans"].update_one({"id": member_id}, {"$set": {"last_membership": max(new_membership_date, last_membership)}})
+            membership_expiry.schedule(member_id, max(new_membership_date, last_membership))
+
+        # if not, create data
+        else:
+            await db["bodans"].insert_one({
+                "id": member_id,
+                "last_membership": new_membership_date
+            })
+            membership_expiry.schedule(member_id, new_membership_date)
+
+        await done("membership", membership_date = new_membership_date, reused = reused)
 
     # Send attachment and message to membership verification channel
-    member_veri_ch = client.get_channel(d["discord_ids"]["membership_verification"])
-    title = res.author.id
-    desc = "{}\n{}".format(str(res.author), new_membership_date.strftime("%d/%m/%Y, %H:%M:%S"))
-    embed = discord.Embed(title = title, description = None, colour = embed_color)
-    embed.set_image(url = res.attachments[0].url)
-    await member_veri_ch.send(content = "```\n{}\n```".format(desc), embed = embed)
+    if not steps.get("posted"):
+        member_veri_ch = client.get_channel(d["discord_ids"]["membership_verification"])
+        title = member_id
+        desc = "{}\n{}".format(str(user), new_membership_date.strftime("%d/%m/%Y, %H:%M:%S"))
+        content = "```\n{}\n```".format(desc)
+        ## flag screenshots that another account already sent
+        for match in reused:
+            m = "\n⚠️ Same screenshot was sent by <@{}> ({}) on {} (hash distance {})"
+            content += m.format(match["member_id"], match["member_id"], match["submitted"].strftime("%d/%m/%Y"), match["distance"])
+        embed = discord.Embed(title = title, description = None, colour = embed_color)
+        embed.set_image(url = job["img_url"])
+        await member_veri_ch.send(content = content, embed = embed)
+        await done("posted")
 
     # add role
-    botan_guild = client.get_guild(d["discord_ids"]["guild"])
-    author = botan_guild.get_member(res.author.id)
-
-    zoopass_role_id = d["discord_ids"]["zoopass_role"]
-    zoopass_role = botan_guild.get_role(zoopass_role_id)
+    in_guild = job.get("in_guild", True)
+    if not steps.get("role"):
+        botan_guild = client.get_guild(d["discord_ids"]["guild"])
+        author = botan_guild.get_member(member_id)
 
-    await author.add_roles(zoopass_role)
+        if author:
+            zoopass_role_id = d["discord_ids"]["zoopass_role"]
+            zoopass_role = botan_guild.get_role(zoopass_role_id)
+            await author.add_roles(zoopass_role)
+        else:
+            # left the server since sending the screenshot, the membership is kept for when they come back
+            print("Verified member {} is not in the server, role not added".format(member_id))
+            in_guild = False
+        await done("role", in_guild = in_guild)
 
     # DM user that the verification process is complete
-    m = "Membership applied! You now have temporary access to members-excusive content in the server."
-    m += "\nPlease note that our staff will double-confirm the verification photo and may revoke it on a case-by-case basis."
-    m += "\nIf you have encountered any issue with accessing the channels or have a separate enquiry, please contact a mod."
-    await res.channel.send(m)
+    if not steps.get("dm"):
+        if in_guild:
+            m = "Membership applied! You now have temporary access to members-excusive content in the server."
+        else:
+            m = "Membership applied! Please rejoin the server and contact a mod to get access to members-exclusive content."
+        m += "\nPlease note that our staff will double-confirm the verification photo and may revoke it on a case-by-case basis."
+        m += "\nIf you have encountered any issue with accessing the channels or have a separate enquiry, please contact a mod."
+        try:
+            await user.send(m)
+        except discord.Forbidden:
+            # DMs closed, or no server shared with the bot anymore, retrying won't help
+            print("Couldn't DM verified member {}".format(member_id))
+            await done("dm", dm_failed = True)
+        else:
+            await done("dm")
+
+async def verification_failed(job):
+    # let the member know their verification couldn't be completed after all attempts
+    user = client.get_user(job["member_id"])
+    if user:
+        if job.get("steps", {}).get("membership"):
+            m = "Your membership was recorded, but something went wrong while finishing your verification. Please contact a mod if you can't access members-exclusive content."
+        else:
+            m = "I'm sorry, something went wrong while processing your verification photo. Please try again later or contact a mod."
+        try:
+            await user.send(m)
+        except discord.HTTPException as e:
+            print("Couldn't DM {} about the failed verification: {!r}".format(job["member_id"], e))
     
 
 ## nsfw dm commands
 async def add_contr(res, msg, contr = 1):
-    member = db["members"].find_one({"id": res.author.id})
+    member = await db["members"].find_one({"id": res.author.id})
     if not member:
         await res.channel.send("Can't find member!")
         return
     old_contr = member["nsfw"]["contributions"]
     new_contr = old_contr + contr
 
-    db["members"].update_one({"id": res.author.id}, {"$set": {"nsfw.contributions": new_contr}})
+    await db["members"].update_one({"id": res.author.id}, {"$set": {"nsfw.contributions": new_contr}})
     m = "You have received one new horny point!\n```\nTotal Horny Points: {}\n```"
     await res.channel.send(m.format(new_contr))
 
@@ -1743,23 +2495,23 @@ async def add_contr(res, msg, contr = 1):
         await add_tick(res, msg)
 
 async def add_tick(res, msg, tick = 1):
-    member = db["members"].find_one({"id": res.author.id})
+    member = await db["members"].find_one({"id": res.author.id})
     if not member:
         await res.channel.send("Can't find member!")
         return
     new_tick = member["nsfw"]["horny_tickets"] + tick
-    db["members"].update_one({"id": res.author.id}, {"$set": {"nsfw.horny_tickets": new_tick}})
+    await db["members"].update_one({"id": res.author.id}, {"$set": {"nsfw.horny_tickets": new_tick}})
     m = "Congratulations! You have proven yourself enough to the Horny Cult! You earned a horny ticket."
     m += "\nYou may use a horny ticket to invite new horny cultists. Use the command ``invite_horny {user id}`` to grant your friend access to the cult!"
     m += "\n```\nHorny Ticket Count: {}\n```".format(new_tick)
     await res.channel.send(m)
 
 async def invite_horny(res, msg):
-    if not is_horny(res.author):
+    if not await is_horny(res.author):
         m = "I'm sorry {}, you have stumbled upon a hidden command!\nTry coming back again once you get the appropriate access."
-        await res.channel.send(m.format(booster_nickname(res.author)))
+        await res.channel.send(m.format(await booster_nickname(res.author)))
         return
-    member = db["members"].find_one({"id": res.author.id})
+    member = await db["members"].find_one({"id": res.author.id})
     tick_count = member["nsfw"]["horny_tickets"]
     if not tick_count:
         await res.channel.send("I'm sorry {}, you don't have enough horny tickets to invite someone! Earn more horny points to get them!")
@@ -1773,9 +2525,9 @@ async def invite_horny(res, msg):
     if not new_member:
         await res.channel.send("Please provide a valid user id!")
     
-    new_member_data = db["members"].find_one({"id": new_member.id})
+    new_member_data = await db["members"].find_one({"id": new_member.id})
     if not new_member_data:
-        db["members"].insert_one({
+        await db["members"].insert_one({
             "id": new_member.id,
             "nsfw": {
                 "is_horny": True,
@@ -1784,13 +2536,13 @@ async def invite_horny(res, msg):
             }
         })
     elif new_member_data["nsfw"]["is_horny"] == False:
-        db["members"].update_one({"id": new_member.id}, {"$set": {"nsfw.is_horny": True}})
+        await db["members"].update_one({"id": new_member.id}, {"$set": {"nsfw.is_horny": True}})
     else:
         m = "Oh mys, this is embarrassing. {} seems to be either too horny or seiso to be able to receive your invitation. Try someone else!"
         await res.channel.send(m.format(new_member.name))
         return
     
-    db["members"].update_one({"id": res.author.id}, {"$set": {"nsfw.horny_tickets": tick_count - 1}})
+    await db["members"].update_one({"id": res.author.id}, {"$set": {"nsfw.horny_tickets": tick_count - 1}})
     m = "A shady figure in hoodie took your horny ticket and blended back into the darkness."
     m += " The cult always delivers, you know for sure {} will receive the invitation, but whether or not they will join the dark side is another story."
     m += "\n```\nHorny Ticket Count: {}\n```"
@@ -1811,29 +2563,29 @@ async def invite_horny(res, msg):
     await new_member.send(content = None , embed = embed)
 
 async def no_horny(res, msg):
-    if not is_horny(res.author):
+    if not await is_horny(res.author):
         m = "I'm sorry {}, you have stumbled upon a hidden command!\nTry coming back again once you get the appropriate access."
-        await res.channel.send(m.format(booster_nickname(res.author)))
+        await res.channel.send(m.format(await booster_nickname(res.author)))
         return
     if msg != "SEISO":
         m = "Warning: This is an irreversible action, continuing the action will opt you out from all nsfw commands unless someone from the nsfw cult sends you another horny ticket."
         m += " To continue, type ``no_horny SEISO`` to stop seeing any future nsfw content."
         await res.channel.send(m)
         return
-    db["members"].update_one({"id": res.author.id}, {"$set": {"nsfw.is_horny": False}})
+    await db["members"].update_one({"id": res.author.id}, {"$set": {"nsfw.is_horny": False}})
     await res.channel.send("*You left the cult's secret entrance with a heavy heart.\nYou don't want to be horny anymore, you promised yourself.*")
 
 async def add_nsfw_art(res, msg):
-    if not is_horny(res.author):
+    if not await is_horny(res.author):
         m = "I'm sorry {}, you have stumbled upon a hidden command!\nTry coming back again once you get the appropriate access."
-        await res.channel.send(m.format(booster_nickname(res.author)))
+        await res.channel.send(m.format(await booster_nickname(res.author)))
         return
     match = re.search(r"https://twitter.com/[a-zA-Z0-9_]+/status/[0-9]+", msg)
     if match:
-        if db["nsfws"].find_one({"url": match.group()}):
+        if await db["nsfws"].find_one({"url": match.group()}):
             await res.channel.send("There's already an existing nsfw art with the same url!")
             return
-        db["nsfws"].insert_one({
+        await db["nsfws"].insert_one({
             "url": match.group(),
             "tag": "other"
         })
@@ -1846,11 +2598,11 @@ async def add_nsfw_art(res, msg):
 
 
 async def nsfw_art(res, msg):
-    if not is_horny(res.author):
+    if not await is_horny(res.author):
         m = "I'm sorry {}, you have stumbled upon a hidden command!\nTry coming back again once you get the appropriate access."
-        await res.channel.send(m.format(booster_nickname(res.author)))
+        await res.channel.send(m.format(await booster_nickname(res.author)))
         return
-    nsfw_url = list(db["nsfws"].aggregate([{"$sample": {"size": 1}}]))[0]["url"]
+    nsfw_url = (await db["nsfws"].aggregate([{"$sample": {"size": 1}}]))[0]["url"]
     await res.channel.send(nsfw_url)
 
 ## hidden developer commands
@@ -1960,6 +2712,7 @@ async def manual_close_tags(res, msg):
     if str(res.author) != owner:
         return
     await res.channel.send("starting")
+    await tag_buffer.flush(msg)
     await process_tags(msg)
     await res.channel.send("processing complete!")
 
@@ -2056,11 +2809,15 @@ admin_commands = {
     "add_vid": add_upcoming_stream,
     "end_vid": end_live_stream,
     "del_vid": delete_stream,
+    "yt_quota": youtube_quota,
     "view_zoopass": view_membership,
     "set_zoopass": set_membership,
     "del_zoopass": del_membership,
     "img_txt": detect_image_text,
     "get_bans": get_bans,
+    "reload_blacklist": reload_blacklist,
+    "render_stats": render_stats,
+    "ocr_stats": ocr_stats,
     "members_count": get_members_count,
     # admins
     "role_reaction": new_role_reaction,
@@ -2114,10 +2871,9 @@ async def on_message(res):
             await ann_ch.send(content = None, embed = embed)
 
             # check if user exists in boosters collections, if not create a new one, else update boosts count
-            booster_data = db["boosters"].find_one({"id": res.author.id})
+            booster_data = await is_booster(res.author)
             if booster_data:
-                booster_data["boosts_count"] += 1
-                db["boosters"].update_one({"id": res.author.id}, {"$set": {"boosts_count": booster_data["boosts_count"]}})
+                await booster_cache.update(res.author.id, {"boosts_count": booster_data["boosts_count"] + 1})
             else:
                 booster_data = {
                     "id": res.author.id,
@@ -2125,7 +2881,7 @@ async def on_message(res):
                     "boosts_count": 1,
                     "custom_role": -1
                 }
-                db["boosters"].insert_one(booster_data)
+                await booster_cache.insert(booster_data)
             return
 
     # check if dm
@@ -2157,8 +2913,8 @@ async def on_message(res):
         # return if not nitro booster or owner
         if not (d["discord_ids"]["booster_role"] in (role.id for role in author.roles) or str(res.author) == owner):
             # if previous booster, use different message
-            if db["boosters"].find_one({"id": res.author.id}):
-                m = "Hi {}! Thanks again for supporting me in the past!\n".format(booster_nickname(author))
+            if await is_booster(res.author):
+                m = "Hi {}! Thanks again for supporting me in the past!\n".format(await booster_nickname(author))
                 m += "I'm sorry but you need the Lion Tamer role again to use any of my commands here...*cries*"
             else:
                 m = "*A horny person appears! Botan flees.*"
@@ -2173,11 +2929,12 @@ async def on_message(res):
 
         # else, send a generic message 
         m = "Sorry {}, I didn't quite catch what you said! Can you say it again in a different way?\nOr use the ``help`` menu to find out more about what I can do!"
-        await res.channel.send(m.format(booster_nickname(author)))
+        await res.channel.send(m.format(await booster_nickname(author)))
         return
 
     # check for banned links
-    if any(True for ban_link in d["blacklist"]["ban_links"] if ban_link in res.content):
+    ban_link = ban_matcher.search(res.content)
+    if ban_link:
         admin_logs = discord.utils.get(res.guild.text_channels, name = "admin-logs")
         await res.delete()
         m = "\n".join([
@@ -2187,6 +2944,8 @@ async def on_message(res):
             res.channel.name,
             "**Action**",
             "immediate message deletion",
+            "**Matched Link**",
+            ban_link,
             "**Message**",
             res.content
         ])
@@ -2198,8 +2957,7 @@ async def on_message(res):
     if str(res.author) == pingcord and res.channel.id == d["discord_ids"]["tweets"]:
         channel = client.get_channel(d["discord_ids"]["translated_tweets"])
         for embed in res.embeds:
-            embed.title = to_eng(embed.title).text
-            embed.description = to_eng(embed.description).text
+            await translate_embed(embed)
             await channel.send(content = None, embed = embed)
     
     # # check for mp4 links and suppress embeds
@@ -2227,7 +2985,7 @@ async def on_message(res):
         image_url = None
         if res.attachments:
             image_url = res.attachments[0].url
-        db["shishilamy"].insert_one({
+        await db["shishilamy"].insert_one({
             "time": dtime.now(tz = timezone.utc),
             "name": res.author.nick if res.author.nick else res.author.name,
             "avatar": str(res.author.avatar_url),
@@ -2301,15 +3059,15 @@ async def on_raw_reaction_add(payload):
     msg_id = payload.message_id
     emoji_str = str(payload.emoji)
 
-    # get reaction data from database
-    reaction_data = db["reactions"].find_one({"msg_id": msg_id})
+    # get reaction data from the in-memory index
+    reactions = (await startup.wait("reactions")).get(msg_id)
 
-    # if reaction_data doesn't exist or emoji_str doesnt exist, return
-    if (not reaction_data) or (not reaction_data["reactions"].get(emoji_str, None)):
+    # if reaction data doesn't exist or emoji_str doesnt exist, return
+    if (not reactions) or (not reactions.get(emoji_str, None)):
         return
 
     # check if user has role
-    role_id = reaction_data["reactions"][emoji_str]
+    role_id = reactions[emoji_str]
     user_roles = set(role.id for role in member.roles)
     target_role = member.guild.get_role(role_id)
 
@@ -2320,11 +3078,8 @@ async def on_raw_reaction_add(payload):
     else:
         await member.add_roles(target_role)
 
-    # remove emoji reaction
-    ch_id = reaction_data["ch_id"]
-    target_channel = client.get_channel(ch_id)
-    target_message = await target_channel.fetch_message(msg_id)
-    await target_message.remove_reaction(payload.emoji, member)
+    # remove emoji reaction directly through the http route (no need to fetch the message)
+    await client.http.remove_reaction(payload.channel_id, msg_id, payload.emoji._as_reaction(), member.id)
 
 # On members joining the server
 @client.event
@@ -2332,88 +3087,7 @@ async def on_member_join(member):
     # welcome message (only for botan server)
     if member.guild.id != d["discord_ids"]["guild"]:
         return
-    
-    ## get data for welcome message
-    wc_ch = client.get_channel(d["discord_ids"]["welcome"])
-    r_ch = client.get_channel(d["discord_ids"]["rules"])
-    member_count  = member.guild.member_count
-    m = "Paao~! Welcome to Shishiro Botan's Den, {}!\nPlease be sure to read the rules in {} and support our lion goddess Botan. ☀️"
-    m = m.format(member.mention, r_ch.mention)
-
-    ## get avatar and resize
-    avatar_url = member.avatar_url
-    av_img = Image.open(requests.get(avatar_url, stream=True).raw)
-    av_img = av_img.resize((250, 250))
-
-    ## draw a mask to crop the ellipse
-    mask_im = Image.new("L", (250, 250), 0)
-    draw = ImageDraw.Draw(mask_im)
-    draw.ellipse((0, 0, 250, 250), fill=255)
-
-    ## open background image, paste in the avatar and the cropping mask
-    bg_file_name = "welcome_background.png"
-    back_im = Image.open(os.path.join(img_dir, bg_file_name)).copy()
-    back_im.paste(av_img, (385, 50), mask_im)    
-
-    ## add fonts
-    lg_ch = client.get_channel(d["discord_ids"]["log"])
-    idraw = ImageDraw.Draw(back_im)
-
-    font_name = "uni-sans.heavy-caps.otf"
-    font_ttf = os.path.join(fonts_dir, font_name)
-
-    welcome_font = ImageFont.truetype(font_ttf, size = 76)
-    name_font = ImageFont.truetype(font_ttf, size = 37)
-    count_font = ImageFont.truetype(font_ttf, size = 30)
-
-    ## shadow layer
-    shadow_fill = (0, 0, 0, 20)
-    shadow_layer = Image.new('RGBA', back_im.size, (255,255,255,0))
-    s_layer = ImageDraw.Draw(shadow_layer)
-
-    ## write messages to image
-    width, height = back_im.size
-    fonts = (welcome_font, name_font, count_font)
-    y_positions = (354, 406, 450)
-    msgs = ("WELCOME", str(member).upper(), "{}th MEMBER!".format(member_count))
-
-    for font, y_pos, msg in zip(fonts, y_positions, msgs):
-        txt_w, txt_h = idraw.textsize(msg, font)
-        pos = ((width-txt_w)/2, y_pos - txt_h/2)
-
-        ## add shadow
-        s_layer.text((pos[0] - 2, pos[1]), msg, font = font, fill = shadow_fill)
-        s_layer.text((pos[0] + 3, pos[1]), msg, font = font, fill = shadow_fill)
-        s_layer.text((pos[0], pos[1] - 3), msg, font = font, fill = shadow_fill)
-        s_layer.text((pos[0], pos[1] + 2), msg, font = font, fill = shadow_fill)
-
-        ## draw text over
-        idraw.text(
-            pos,
-            msg,
-            font = font,
-            fill = (255, 255, 255, 255)
-        )
-    
-    combined_im = Image.alpha_composite(back_im, shadow_layer)
-
-    ## save image
-    save_file = os.path.join(save_dir, str(random.randint(1,20)) + "wc_bg.png")
-    combined_im.save(save_file)
-
-    await wc_ch.send(m, file = discord.File(save_file))
-
-    ## send member's join info to mods logs
-    server_logs_ch = client.get_channel(d["discord_ids"]["server_log"])
-    
-    m = "{} {}".format(member.mention, str(member))
-
-    embed = discord.Embed(title = "Member Joined", description = m, colour = 0xE2FAB5)
-    embed.set_thumbnail(url = member.avatar_url)
-    embed.add_field(name = "Account Creation Date", value = member.created_at, inline = False)
-    embed.set_footer(text = "ID: {}".format(member.id))
-
-    await server_logs_ch.send(content = None, embed = embed)
+    welcome_queue.put(member)
 
 # On members leaving the server
 @client.event
@@ -2492,18 +3166,18 @@ async def on_member_update(before, after):
         # If member loses Lion Tamer role
         elif d["discord_ids"]["booster_role"] in (old_roles - new_roles) or 748842249030336542 in (old_roles - new_roles):
             # Get booster data
-            custom_role_id = db["boosters"].find_one({"id": after.id})["custom_role"]
+            custom_role_id = (await is_booster(after))["custom_role"]
             botan_guild = client.get_guild(d["discord_ids"]["guild"])
 
             # If custom role id is not -1, remove existing custom role
             if custom_role_id != -1:
                 custom_role = botan_guild.get_role(custom_role_id)
                 await custom_role.delete(reason = "{}'s lion tamer's subscription expired".format(str(after)))
-                db["boosters"].update_one({"id": after.id}, {"$set": {"custom_role": -1}})          
+                await booster_cache.update(after.id, {"custom_role": -1})
 
             # Send dm informing the expiration
             title = "Lion Tamer's subscription expired"
-            m = "Hi {}, I would like to inform you that your **Lion Tamer**'s role privileges have just expired.".format(booster_nickname(after))
+            m = "Hi {}, I would like to inform you that your **Lion Tamer**'s role privileges have just expired.".format(await booster_nickname(after))
             m += " You may renew this subscription by boosting the server again, but regardless of your decision, it has been great to have you with me!"
             m += " Thank you so much for your patronage!"
             embed = discord.Embed(title = title, description = m, colour = embed_color)
@@ -2526,8 +3200,10 @@ async def jst_clock():
     "scheduled_start_time"
     "actual_start_time"
     "actual_end_time"
-    "tag_count": 1
-    "tags": {
+    "tag_count": 1 (tags are stored in db["stream_tags"], see streams.py)
+    "archive_link_msg": id of the video link message in the archive channel
+    "archive_msgs": [{"id": message id, "hash": content hash of the embed page}, ...]
+    "tags": { (legacy, streams tagged before stream_tags)
         "0": {
             "author_id": author's id,
             "timestamp": datetime,
@@ -2542,18 +3218,33 @@ async def update_streams():
     live_ch = client.get_channel(d["discord_ids"]["live_stream"])
     botan_guild = client.get_guild(d["discord_ids"]["guild"])
     stream_role_mention = botan_guild.get_role(d["discord_ids"]["stream_role"]).mention
+    youtube = await startup.wait("youtube")
 
     while not client.is_closed():
         now = dtime.now(tz = timezone.utc)
+        live_vids = await stream_repo.by_status(("live",), ("id", "live_msg", "end"))
+        upcoming_vids = await stream_repo.by_status(("upcoming", "justlive"), ("id", "status", "scheduled_start_time"))
+        # only upcoming streams starting within 1 minute need youtube data
+        upcoming_vids = [vid for vid in upcoming_vids if now + timedelta(minutes = 1) >= vid["scheduled_start_time"].replace(tzinfo = timezone.utc)]
+
+        # fetch every tracked stream's data in one batched request
+        vid_ids = [vid["id"] for vid in live_vids + upcoming_vids]
+        try:
+            videos = await youtube.videos(vid_ids, "liveStreamingDetails,statistics")
+        except QuotaExceeded:
+            videos = {}
+        except RequestFailed as e:
+            # network trouble, try again next cycle
+            print("YouTube videos request failed: {!r}".format(e))
+            videos = {}
+
         # check live streams, see if any is finishing
-        for vid in db["streams"].find({"status": "live"}):
+        for vid in live_vids:
             # get live vid data
             vid_id = vid["id"]
-            vid_req = youtube.videos().list(
-                part = "liveStreamingDetails,statistics",
-                id = vid_id
-            )
-            vid_res = vid_req.execute()["items"][0]
+            vid_res = videos.get(vid_id)
+            if not vid_res:
+                continue
 
             # if vid is ending, send message and update status to completed
             live_streaming_details = vid_res["liveStreamingDetails"]
@@ -2568,11 +3259,11 @@ async def update_streams():
                     actual_end_time = dtime.strptime(actual_end_time_str, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo = timezone.utc)
                 else:
                     actual_end_time = None
-                db["streams"].update_one({"id": vid_id}, {"$set": {
+                await stream_repo.update(vid_id, {
                     "status": "completed", 
                     "actual_start_time": actual_start_time,
                     "actual_end_time": actual_end_time
-                }})
+                })
 
                 # send an embed message
                 embed = discord.Embed(description = "Live stream ended! You may refer to <#751210778278756375> for any tagged comments.", colour = embed_color)
@@ -2582,7 +3273,9 @@ async def update_streams():
                 live_msg = await live_ch.fetch_message(vid["live_msg"])
                 await live_msg.unpin(reason = "Unpin stream after ended.")
 
-                # process tags
+                # process tags (after writing out the ones still buffered)
+                live_stream_cache["checked"] = None
+                await tag_buffer.flush(vid_id)
                 await process_tags(vid_id)
                 continue
 
@@ -2603,24 +3296,14 @@ async def update_streams():
             await live_msg.edit(content = m)
 
         # check upcoming streams, see if there's any live ones in 1 minute
-        for vid in db["streams"].find({
-            "$or": [
-                {"status": "upcoming"},
-                {"status": "justlive"}
-            ]
-        }):
-            # if scheduled time's not reached, skip vid
+        for vid in upcoming_vids:
             scheduled_start_time = vid["scheduled_start_time"].replace(tzinfo = timezone.utc)
-            if now + timedelta(minutes = 1) < scheduled_start_time:
-                continue
             await lg_ch.send("vid live! Starting operation")
             # if live, get live vid data
             vid_id = vid["id"]
-            vid_req = youtube.videos().list(
-                part = "liveStreamingDetails,statistics",
-                id = vid_id
-            )
-            vid_res = vid_req.execute()["items"][0]
+            vid_res = videos.get(vid_id)
+            if not vid_res:
+                continue
             await lg_ch.send("successfully received vid's data from youtube")
 
             # double confirm if the vid is live, else reschedule
@@ -2630,7 +3313,7 @@ async def update_streams():
             await lg_ch.send(dt_string)
             new_scheduled_time = dtime.strptime(dt_string, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo = timezone.utc)
             if new_scheduled_time > scheduled_start_time + timedelta(minutes = 1):
-                db["streams"].update_one({"id": vid_id}, {"$set": {"scheduled_start_time": new_scheduled_time}})
+                await stream_repo.update(vid_id, {"scheduled_start_time": new_scheduled_time})
                 await lg_ch.send("{} has been rescheduled to {}".format(vid_id, new_scheduled_time))
                 continue
 
@@ -2654,15 +3337,18 @@ async def update_streams():
             await live_ch.send(content = None, embed = embed)
 
             # update the status to live, record message id
-            db["streams"].update_one({"id": vid_id}, {"$set": {"status": "live", "live_msg": live_msg.id}})
+            await stream_repo.update(vid_id, {"status": "live", "live_msg": live_msg.id})
+            live_stream_cache["checked"] = None
             await lg_ch.send("{} is now live".format(vid_id))
-        await asyncio.sleep(30)
+        # poll less often once the daily quota budget is used up
+        await asyncio.sleep(300 if youtube.over_budget() else 30)
 
 async def find_streams():
     lg_ch = client.get_channel(d["discord_ids"]["log"])
+    youtube = await startup.wait("youtube")
     while not client.is_closed():
         # get data of last checked timestamp
-        stream_check = db["settings"].find_one({"name": "stream"})
+        stream_check = await db["settings"].find_one({"name": "stream"})
         last_checked = stream_check.get("last_checked", None)
         now = dtime.now(tz = timezone.utc)
         await lg_ch.send("Checking if live stream check is needed, time: {}".format(now))
@@ -2670,30 +3356,43 @@ async def find_streams():
         if last_checked:
             # add utc to last checked (mongodb always naive)
             last_checked = last_checked.replace(tzinfo = timezone.utc)
-        if not last_checked or (now - last_checked >= timedelta(hours = 1)):
+        check_needed = not last_checked or (now - last_checked >= timedelta(hours = 1))
+        if check_needed and youtube.over_budget(2 * youtube.costs["search.list"]):
+            # skip the expensive searches until the quota budget frees up
+            await lg_ch.send("YouTube quota budget reached ({} units used today), skipping live stream check".format(youtube.units_today()))
+            wait_time = 3600
+        elif check_needed:
             await lg_ch.send("Performing live stream check, last check was {}".format(last_checked))
-            # check for live streams
-            live_req = youtube.search().list(
-                part = "snippet",
-                channelId = botan_ch_id,
-                eventType = "live",
-                maxResults = 25,
-                type = "video"
-            )
-            live_res = live_req.execute()["items"]
-            for vid in live_res:
-                vid_id = vid["id"]["videoId"]
-                # check if vid already exists in database
-                if db["streams"].find_one({"id": vid_id}):
-                    continue
-                # else store video's id, status and scheduled start time
-                vid_req = youtube.videos().list(
-                    part = "snippet,liveStreamingDetails",
-                    id = vid_id
-                )
+            # check for live and upcoming streams
+            search_results = []
+            for event_type, status in (("live", "justlive"), ("upcoming", "upcoming")):
                 try:
-                    vid_res = vid_req.execute()["items"][0]
-                except:
+                    search_res = await youtube.search(botan_ch_id, event_type, max_results = 25)
+                except QuotaExceeded:
+                    search_res = []
+                except RequestFailed as e:
+                    print("YouTube search request failed: {!r}".format(e))
+                    search_res = []
+                for vid in search_res:
+                    search_results.append((vid["id"]["videoId"], status))
+
+            # skip vids that already exist in database (one query for all of them)
+            existing_ids = await stream_repo.existing_ids(vid_id for vid_id, status in search_results)
+            search_results = [(vid_id, status) for vid_id, status in search_results if vid_id not in existing_ids]
+
+            # get every new video's data in one batched request
+            try:
+                videos = await youtube.videos([vid_id for vid_id, status in search_results], "snippet,liveStreamingDetails")
+            except QuotaExceeded:
+                videos = {}
+            except Exception as e:
+                print("YouTube videos request failed: {!r}".format(e))
+                videos = {}
+
+            # store video's id, status and scheduled start time
+            for vid_id, status in search_results:
+                vid_res = videos.get(vid_id)
+                if not vid_res:
                     continue
 
                 title = vid_res["snippet"]["title"]
@@ -2701,58 +3400,21 @@ async def find_streams():
                 dt_string = vid_res["liveStreamingDetails"]["scheduledStartTime"]
                 scheduled_start_time = dtime.strptime(dt_string, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo = timezone.utc)
 
-                vid_data = {
-                    "id": vid_id,
-                    "title": title,
-                    "status": "justlive",
-                    "scheduled_start_time": scheduled_start_time
-                }
-                db["streams"].insert_one(vid_data)
-                await lg_ch.send("New live video logged!\n{}\n{}".format(vid_id, scheduled_start_time))
-
-            # check for upcoming streams
-            upcoming_req = youtube.search().list(
-                part = "snippet",
-                channelId = botan_ch_id,
-                eventType = "upcoming",
-                maxResults = 25,
-                type = "video"
-            )
-            upcoming_res = upcoming_req.execute()["items"]
-            for vid in upcoming_res:
-                vid_id = vid["id"]["videoId"]
-                # check if vid already exists in database
-                if db["streams"].find_one({"id": vid_id}):
-                    continue
-                # else store video's id, status and scheduled start time
-                vid_req = youtube.videos().list(
-                    part = "snippet,liveStreamingDetails",
-                    id = vid_id
-                )
-                try:
-                    vid_res = vid_req.execute()["items"][0]
-                except:
-                    continue
-
-                title = vid_res["snippet"]["title"]
-
-                dt_string = vid_res["liveStreamingDetails"]["scheduledStartTime"]
-                scheduled_start_time = dtime.strptime(dt_string, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo = timezone.utc)
-                
-                # if vid is already starting (completed), skip vid
-                if now > scheduled_start_time:
+                # if upcoming vid is already starting (completed), skip vid
+                if status == "upcoming" and now > scheduled_start_time:
                     continue
 
                 vid_data = {
                     "id": vid_id,
                     "title": title,
-                    "status": "upcoming",
+                    "status": status,
                     "scheduled_start_time": scheduled_start_time
                 }
-                db["streams"].insert_one(vid_data)
-                await lg_ch.send("New upcoming video logged!\n{}\n{}".format(vid_id, scheduled_start_time))            
+                await stream_repo.insert(vid_data)
+                m = "New live video logged!\n{}\n{}" if status == "justlive" else "New upcoming video logged!\n{}\n{}"
+                await lg_ch.send(m.format(vid_id, scheduled_start_time))
             # add wait time
-            db["settings"].update_one({"name": "stream"}, {"$set": {"last_checked": now}})
+            await db["settings"].update_one({"name": "stream"}, {"$set": {"last_checked": now}})
             wait_time = 3600
         else:
             # else wait for the remaining time left
@@ -2760,44 +3422,15 @@ async def find_streams():
             await lg_ch.send("Waiting for {} seconds from now for next check".format(wait_time))
         await asyncio.sleep(wait_time)
 
-async def delete_expired_memberships():
-    lg_ch = client.get_channel(d["discord_ids"]["log"])
-    while not client.is_closed():
-        # get data of last checked timestamp
-        now = dtime.now(tz = timezone.utc)
-        zoopass_check = db["settings"].find_one({"name": "zoopass"})
-        last_checked = zoopass_check.get("last_checked", None)
-        await lg_ch.send("Checking if **membership** check is needed, time: {}".format(now))
-        # if there is no last checked, or last checked is more than 12 hours ago, do new check
-        if last_checked:
-            # add utc to last checked (mongodb always naive)
-            last_checked = last_checked.replace(tzinfo = timezone.utc)
-        if not last_checked or (now - last_checked >= timedelta(hours = 12)):
-            await lg_ch.send("Performing membership check, last check was {}".format(last_checked))
-            
-            # perform check
-            expired_memberships = await _check_membership_dates()
-            m = ["{}: {}".format(d["id"], d["last_membership"]) for d in expired_memberships]
-            m = "\n".join(m)
-            if m:
-                await lg_ch.send(m)
-
-            # add wait time
-            db["settings"].update_one({"name": "zoopass"}, {"$set": {"last_checked": now}})
-            wait_time = 12 * 3600
-            await lg_ch.send("Set new wait time to {}".format(now))
-        else:
-            # else wait for the remaining time left
-            wait_time = 12 * 3600 - (now - last_checked).total_seconds()
-            await lg_ch.send("Waiting for {} seconds from now for next **membership** check".format(wait_time))
-        await asyncio.sleep(wait_time)
-
 # List Coroutines to be executed
 coroutines = (
     jst_clock(),
     update_streams(),
     find_streams(),
-    delete_expired_memberships()
+    membership_expiry.run(),
+    welcome_queue.run(),
+    verification_queue.run(),
+    tag_buffer.run()
 )
 
 # Main Coroutine
@@ -2805,6 +3438,7 @@ async def background_main():
     await client.wait_until_ready()
     await asyncio.gather(*coroutines)
 
+client.loop.create_task(startup.run())
 client.loop.create_task(background_main())
 client.run(token)
 
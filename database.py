@@ -0,0 +1,188 @@
+# Async data access layer for botanDB
+#
+# pymongo is synchronous, so every call is sent to a small, bounded thread pool
+# and awaited from the event loop. This keeps slow Atlas round trips from
+# stalling the discord gateway.
+
+# python built-in libraries
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+"""collections with a dedicated repository"""
+collection_names = (
+    "bodans",
+    "streams",
+    "boosters",
+    "reactions",
+    "trivia",
+    "artworks",
+    "nsfws",
+    "members",
+    "valentines",
+    "settings",
+    "shishilamy",
+    "verification_images",
+    "verification_jobs",
+    "stream_tags"
+)
+
+class Repository:
+    # async wrapper around one pymongo collection
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+
+    @property
+    def collection(self):
+        return self.database.pymongo_db[self.name]
+
+    async def _run(self, method_name, *args, **kwargs):
+        # run a collection method in the database executor
+        method = getattr(self.collection, method_name)
+        return await self.database.run(partial(method, *args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return await self._run("find_one", *args, **kwargs)
+
+    async def find(self, *args, **kwargs):
+        # cursors are lazy, so the whole result is fetched inside the executor
+        def fetch_all():
+            return list(self.collection.find(*args, **kwargs))
+        return await self.database.run(fetch_all)
+
+    async def find_batches(self, *args, batch_size = 500, **kwargs):
+        # async iterator over a large query, yields lists of up to batch_size documents
+        # only one batch is held in memory at a time
+        await self.database.connected.wait()
+        cursor = self.collection.find(*args, batch_size = batch_size, **kwargs)
+        def next_batch():
+            return list(islice(cursor, batch_size))
+        try:
+            while True:
+                batch = await self.database.run(next_batch)
+                if not batch:
+                    return
+                yield batch
+        finally:
+            cursor.close()
+
+    async def aggregate(self, pipeline, **kwargs):
+        def fetch_all():
+            return list(self.collection.aggregate(pipeline, **kwargs))
+        return await self.database.run(fetch_all)
+
+    async def count_documents(self, *args, **kwargs):
+        return await self._run("count_documents", *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self._run("insert_one", *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self._run("insert_many", *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self._run("update_one", *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await self._run("update_many", *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await self._run("find_one_and_update", *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await self._run("delete_one", *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await self._run("delete_many", *args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        return await self._run("bulk_write", *args, **kwargs)
+
+    async def create_index(self, *args, **kwargs):
+        return await self._run("create_index", *args, **kwargs)
+
+class Database:
+    # holds one repository per collection, accessed like pymongo: db["bodans"]
+    # the pymongo database is attached later by connect(), calls made before that wait for it
+
+    def __init__(self, max_workers = 8):
+        self.pymongo_db = None
+        self.connected = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "mongo")
+        self.repositories = {name: Repository(self, name) for name in collection_names}
+
+    def __getitem__(self, name):
+        if name not in self.repositories:
+            self.repositories[name] = Repository(self, name)
+        return self.repositories[name]
+
+    async def connect(self, connect_func):
+        # connect_func builds and returns the pymongo database (blocking, runs in the executor)
+        loop = asyncio.get_event_loop()
+        self.pymongo_db = await loop.run_in_executor(self.executor, connect_func)
+        self.connected.set()
+        return self
+
+    async def run(self, func):
+        # run a blocking pymongo call on the database executor
+        await self.connected.wait()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, func)
+
+if __name__ == "__main__":
+    # load test: a simulated gateway keeps ticking while slow database calls are in flight
+    # compares calling a slowed pymongo call on the event loop against Database.run
+    import time
+
+    tick_interval = 0.01
+    slow_seconds = 0.5
+    slow_calls = 8
+
+    def slow_call():
+        # stands in for a slow Atlas round trip
+        time.sleep(slow_seconds)
+        return True
+
+    async def gateway(stop):
+        # a stream of small events, records how late each one was handled
+        ticks, max_lag = 0, 0.0
+        loop = asyncio.get_event_loop()
+        while not stop.is_set():
+            expected = loop.time() + tick_interval
+            await asyncio.sleep(tick_interval)
+            max_lag = max(max_lag, loop.time() - expected)
+            ticks += 1
+        return ticks, max_lag
+
+    async def measure(run_calls):
+        stop = asyncio.Event()
+        gateway_task = asyncio.ensure_future(gateway(stop))
+        # let the gateway start ticking before the slow calls begin
+        await asyncio.sleep(tick_interval * 2)
+        start = time.perf_counter()
+        await run_calls()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        ticks, max_lag = await gateway_task
+        return elapsed, ticks, max_lag
+
+    async def blocking():
+        for i in range(slow_calls):
+            slow_call()
+
+    async def main():
+        db = Database(max_workers = 8)
+        await db.connect(lambda: None)
+
+        async def through_executor():
+            await asyncio.gather(*(db.run(slow_call) for i in range(slow_calls)))
+
+        for name, run_calls in (("blocking on the loop", blocking), ("Database.run", through_executor)):
+            elapsed, ticks, max_lag = await measure(run_calls)
+            print("{}: {} slow calls took {:.2f}s, {} gateway ticks ({:.0f}/s), max lag {:.0f}ms".format(
+                name, slow_calls, elapsed, ticks, ticks / elapsed, max_lag * 1000))
+
+    asyncio.get_event_loop().run_until_complete(main())
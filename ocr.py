@@ -0,0 +1,308 @@
+# OCR worker pool
+#
+# Each worker thread owns one long-lived PyTessBaseAPI, so the traineddata is
+# loaded once per worker instead of once per image. Jobs go through a shared
+# queue and are awaited from the event loop. tesserocr releases the GIL while
+# recognizing, so worker threads run in parallel.
+#
+# find_text is the fast path for screenshots: the image is downscaled and
+# binarized once, then the normal and inverted copies are scanned line by line
+# on two workers, and both stop as soon as one line satisfies the predicate.
+#
+# dhash and HashIndex recognize resubmitted screenshots (same image, resized or
+# recompressed) so their OCR result can be reused.
+
+# external libraries
+from PIL import Image, ImageOps
+from tesserocr import PyTessBaseAPI, RIL
+
+# python built-in libraries
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+
+## preprocessing
+def otsu_threshold(gray):
+    # threshold that best separates the histogram of a grayscale image into two classes
+    hist = gray.histogram()
+    total = sum(hist)
+    sum_all = sum(i * count for i, count in enumerate(hist))
+    sum_back = weight_back = 0
+    best, threshold = 0, 127
+    for i, count in enumerate(hist):
+        weight_back += count
+        if not weight_back:
+            continue
+        weight_fore = total - weight_back
+        if not weight_fore:
+            break
+        sum_back += i * count
+        mean_back = sum_back / weight_back
+        mean_fore = (sum_all - sum_back) / weight_fore
+        between = weight_back * weight_fore * (mean_back - mean_fore) ** 2
+        if between > best:
+            best, threshold = between, i
+    return threshold
+
+def preprocess(img, max_width = 1280):
+    # flatten transparency, grayscale, downscale and binarize
+    # returns (normal, inverted) black and white copies ready for tesseract
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, img)
+    gray = img.convert("L")
+    if gray.width > max_width:
+        gray = gray.resize((max_width, round(gray.height * max_width / gray.width)), Image.BILINEAR)
+    threshold = otsu_threshold(gray)
+    binary = gray.point(lambda value: 255 if value > threshold else 0)
+    return binary, ImageOps.invert(binary)
+
+## perceptual hashing
+def dhash(img, hash_size = 16):
+    # difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy
+    # (256 bits by default), recompression and rescaling only flip a few bits
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class HashIndex:
+    # near-duplicate lookup of perceptual hashes
+    # each hash is split into bands; two hashes that differ in fewer bits than there are
+    # bands share at least one band exactly, so only hashes in matching buckets are compared
+
+    def __init__(self, bits = 256, bands = 16, max_distance = 10):
+        self.band_bits = bits // bands
+        self.bands = bands
+        self.max_distance = min(max_distance, bands - 1)
+        self.buckets = [{} for i in range(bands)]
+        self.items = {}
+
+    def __len__(self):
+        return sum(len(items) for items in self.items.values())
+
+    def _keys(self, value):
+        mask = (1 << self.band_bits) - 1
+        return [(value >> (self.band_bits * band)) & mask for band in range(self.bands)]
+
+    def add(self, value, item):
+        if value not in self.items:
+            self.items[value] = []
+            for bucket, key in zip(self.buckets, self._keys(value)):
+                bucket.setdefault(key, []).append(value)
+        self.items[value].append(item)
+
+    def find(self, value):
+        # returns [(distance, item)] for every item within max_distance, closest first
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._keys(value)):
+            candidates.update(bucket.get(key, ()))
+        matches = []
+        for candidate in candidates:
+            distance = hamming(value, candidate)
+            if distance <= self.max_distance:
+                matches.extend((distance, item) for item in self.items[candidate])
+        matches.sort(key = lambda match: match[0])
+        return matches
+
+## jobs (run on a worker, the worker's api is passed first)
+def image_to_text(api, img):
+    # default job: recognize a whole PIL image
+    api.SetImage(img)
+    return api.GetUTF8Text()
+
+def scan_lines(api, img, predicate, stop):
+    # find text lines with layout analysis only, then recognize them one at a time
+    # returns (first line satisfying predicate or None, text recognized so far)
+    # gives up early once stop (a threading.Event) is set by another pass
+    api.SetImage(img)
+    lines = api.GetComponentImages(RIL.TEXTLINE, True)
+    texts = []
+    for line_img, box, block_id, para_id in lines:
+        if stop.is_set():
+            break
+        api.SetRectangle(box["x"], box["y"], box["w"], box["h"])
+        text = api.GetUTF8Text()
+        texts.append(text)
+        if predicate(text):
+            return text, "".join(texts)
+    return None, "".join(texts)
+
+class OCRPool:
+    def __init__(self, workers = 2, path = None, lang = "eng"):
+        self.workers = workers
+        self.path = path
+        self.lang = lang
+        self.jobs = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.metrics = {
+            "completed": 0,
+            "failed": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "recognition_seconds": 0.0,
+            "max_recognition_seconds": 0.0
+        }
+
+    def start(self):
+        # start the workers and block until every one of them has loaded its language data
+        barrier = threading.Barrier(self.workers + 1)
+        errors = []
+        for i in range(self.workers):
+            thread = threading.Thread(target = self._worker, args = (barrier, errors), name = "ocr-{}".format(i), daemon = True)
+            thread.start()
+            self.threads.append(thread)
+        barrier.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def close(self):
+        for thread in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _record(self, wait, elapsed, failed):
+        with self.lock:
+            self.metrics["failed" if failed else "completed"] += 1
+            self.metrics["wait_seconds"] += wait
+            self.metrics["max_wait_seconds"] = max(self.metrics["max_wait_seconds"], wait)
+            self.metrics["recognition_seconds"] += elapsed
+            self.metrics["max_recognition_seconds"] = max(self.metrics["max_recognition_seconds"], elapsed)
+
+    def _worker(self, barrier, errors):
+        try:
+            api = PyTessBaseAPI(path = self.path, lang = self.lang) if self.path else PyTessBaseAPI(lang = self.lang)
+        except Exception as e:
+            errors.append(e)
+            barrier.wait()
+            return
+        barrier.wait()
+
+        with api:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    return
+                func, args, future, queued_at = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+                start = time.perf_counter()
+                try:
+                    result = func(api, *args)
+                except Exception as e:
+                    self._record(start - queued_at, time.perf_counter() - start, True)
+                    future.set_exception(e)
+                else:
+                    self._record(start - queued_at, time.perf_counter() - start, False)
+                    future.set_result(result)
+                finally:
+                    # don't let one job's image or variables leak into the next
+                    api.Clear()
+
+    def submit(self, func, *args):
+        # queue func(api, *args) on a worker, returns a concurrent.futures.Future
+        future = Future()
+        self.jobs.put((func, args, future, time.perf_counter()))
+        return future
+
+    async def run(self, func, *args):
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    async def image_to_text(self, img):
+        return await self.run(image_to_text, img)
+
+    async def find_text(self, img, predicate):
+        # scan the normal and inverted copies of img at the same time
+        # returns (first line satisfying predicate or None, [text of each pass])
+        loop = asyncio.get_event_loop()
+        images = await loop.run_in_executor(None, preprocess, img)
+        stop = threading.Event()
+        passes = [asyncio.wrap_future(self.submit(scan_lines, pass_img, predicate, stop)) for pass_img in images]
+        found = None
+        errors = []
+        try:
+            for next_pass in asyncio.as_completed(passes):
+                try:
+                    line, text = await next_pass
+                except Exception as e:
+                    # the other pass may still find it
+                    errors.append(e)
+                    continue
+                if line is not None:
+                    found = line
+                    break
+        finally:
+            stop.set()
+        if len(errors) == len(passes):
+            raise errors[0]
+        texts = [future.result()[1] if future.done() and not future.exception() else "" for future in passes]
+        return found, texts
+
+    def stats(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        jobs = metrics["completed"] + metrics["failed"]
+        metrics["average_wait_seconds"] = metrics["wait_seconds"] / jobs if jobs else 0
+        metrics["average_recognition_seconds"] = metrics["recognition_seconds"] / jobs if jobs else 0
+        metrics["queued"] = self.jobs.qsize()
+        return metrics
+
+if __name__ == "__main__":
+    # benchmark: repeated verifications (normal + inverted image), per-call api vs the pool
+    # usage: python ocr.py [screenshot] (TESSDATA_PREFIX must point to the tessdata directory)
+    import sys
+    import tesserocr
+    from PIL import ImageDraw, ImageFont
+
+    if len(sys.argv) > 1:
+        img = Image.open(sys.argv[1]).convert("RGB")
+    else:
+        img = Image.new("RGB", (900, 300), (255, 255, 255))
+        idraw = ImageDraw.Draw(img)
+        font = ImageFont.truetype("fonts/Roboto-Regular.ttf", size = 32)
+        idraw.text((20, 40), "Shishiro Botan Ch. - Membership", font = font, fill = (0, 0, 0))
+        idraw.text((20, 120), "Next billing date: Feb 14, 2021", font = font, fill = (0, 0, 0))
+    inverted_img = ImageOps.invert(img)
+    runs = 10
+
+    start = time.perf_counter()
+    for i in range(runs):
+        tesserocr.image_to_text(img)
+        tesserocr.image_to_text(inverted_img)
+    per_call = (time.perf_counter() - start) / runs
+
+    pool = OCRPool(workers = 2).start()
+    async def verify():
+        return await asyncio.gather(pool.image_to_text(img), pool.image_to_text(inverted_img))
+    async def verify_fast():
+        return await pool.find_text(img, lambda text: "2021" in text)
+    def timed(func):
+        async def main():
+            for i in range(runs):
+                await func()
+        start = time.perf_counter()
+        asyncio.get_event_loop().run_until_complete(main())
+        return (time.perf_counter() - start) / runs
+    pooled = timed(verify)
+    fast = timed(verify_fast)
+    pool.close()
+
+    print("per-call api: {:.0f}ms per verification".format(per_call * 1000))
+    print("worker pool: {:.0f}ms per verification".format(pooled * 1000))
+    print("worker pool, preprocessed line scan: {:.0f}ms per verification".format(fast * 1000))
+    print(pool.stats())
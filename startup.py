@@ -0,0 +1,61 @@
+# Startup orchestration
+#
+# Resources that need network round trips (database, youtube client, preloaded
+# caches) are registered as stages and warmed concurrently in the background
+# while the bot connects to the gateway. Anything that needs a resource awaits
+# its readiness future with startup.wait(name).
+
+# python built-in libraries
+import asyncio
+import time
+
+class Startup:
+    def __init__(self, loop = None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.stages = {}
+        self.futures = {}
+        self.timings = {}
+
+    def stage(self, name, after = ()):
+        # decorator registering a coroutine function as a startup stage
+        # stages listed in after are awaited before this stage starts
+        def decorator(func):
+            self.stages[name] = (func, tuple(after))
+            self.future(name)
+            return func
+        return decorator
+
+    def future(self, name):
+        if name not in self.futures:
+            self.futures[name] = self.loop.create_future()
+        return self.futures[name]
+
+    async def wait(self, name):
+        # wait for a stage to finish and return its result
+        # shield so a cancelled waiter can't cancel the stage's future for everyone else
+        return await asyncio.shield(self.future(name))
+
+    async def _run_stage(self, name):
+        func, after = self.stages[name]
+        future = self.future(name)
+        try:
+            for dependency in after:
+                await self.wait(dependency)
+            start = time.perf_counter()
+            result = await func()
+        except Exception as e:
+            print("Startup stage {} failed: {!r}".format(name, e))
+            future.set_exception(e)
+            # already printed, don't let asyncio log it again if no one waits for this stage
+            future.exception()
+            return
+        self.timings[name] = time.perf_counter() - start
+        future.set_result(result)
+        print("Startup stage {} took {:.2f}s".format(name, self.timings[name]))
+
+    async def run(self):
+        # run every registered stage concurrently
+        start = time.perf_counter()
+        await asyncio.gather(*(self._run_stage(name) for name in self.stages))
+        print("Startup finished in {:.2f}s".format(time.perf_counter() - start))
+        return self.timings
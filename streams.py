@@ -0,0 +1,278 @@
+# Live stream tag storage
+#
+# Every $t tag is its own document in db["stream_tags"] instead of an entry in
+# a dict on the stream document, so adding a tag is one small insert no matter
+# how many tags the stream already has. Positions come from an atomic $inc on
+# the stream's tag_count, so concurrent tags can't overwrite each other.
+#
+# TagBuffer sits in front of the store while a stream is live and writes tags
+# in bulk, so a burst of tags costs one counter update and one insert. Each tag
+# gets its _id when buffered and keeps its position once reserved, so a flush
+# retried after a partial insert writes the missing tags and nothing twice.
+#
+# StreamRepository is the way into db["streams"]: every query names the fields
+# it needs, so polling loops never load the legacy tags of a stream document.
+
+# external libraries
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne, ASCENDING
+from pymongo.errors import BulkWriteError
+
+# python built-in libraries
+import asyncio
+
+def projection(fields):
+    return dict({"_id": False}, **{field: True for field in fields})
+
+class StreamRepository:
+    def __init__(self, db, name = "streams"):
+        self.streams = db[name]
+
+    async def create_indexes(self):
+        await self.streams.create_index("id")
+        await self.streams.create_index("status")
+
+    async def exists(self, vid_id):
+        return await self.streams.count_documents({"id": vid_id}, limit = 1) > 0
+
+    async def existing_ids(self, vid_ids):
+        # which of vid_ids are already in the database, in one query
+        streams = await self.streams.find({"id": {"$in": list(vid_ids)}}, projection = projection(("id",)))
+        return {stream["id"] for stream in streams}
+
+    async def get(self, vid_id, fields = None):
+        # fields = None loads the whole document (tags included)
+        return await self.streams.find_one({"id": vid_id}, projection = projection(fields) if fields else {"_id": False})
+
+    async def first_by_status(self, statuses, fields):
+        return await self.streams.find_one({"status": {"$in": list(statuses)}}, projection = projection(fields))
+
+    async def by_status(self, statuses, fields):
+        return await self.streams.find({"status": {"$in": list(statuses)}}, projection = projection(fields))
+
+    async def insert(self, vid_data):
+        await self.streams.insert_one(vid_data)
+
+    async def update(self, vid_id, fields):
+        await self.streams.update_one({"id": vid_id}, {"$set": fields})
+
+    async def delete(self, vid_id):
+        await self.streams.delete_one({"id": vid_id})
+
+"""tag document in db["stream_tags"]
+{
+    "_id": ObjectId (given when the tag is buffered),
+    "vid_id": vid id,
+    "seq": int (position in the stream, continues after any legacy tags),
+    "author_id": author's id,
+    "timestamp": datetime,
+    "seconds": int (set by process_tags),
+    "text": "loren itsum"
+}
+"""
+
+class TagStore:
+    def __init__(self, db, streams = "streams", tags = "stream_tags"):
+        self.streams = db[streams]
+        self.tags = db[tags]
+
+    async def create_indexes(self):
+        await self.tags.create_index([("vid_id", ASCENDING), ("seq", ASCENDING)], unique = True)
+
+    async def reserve(self, vid_id, count = 1):
+        # atomically reserve count positions on the stream, returns the first one
+        # or None if the stream doesn't exist
+        stream = await self.streams.find_one_and_update(
+            {"id": vid_id},
+            {"$inc": {"tag_count": count}},
+            projection = {"_id": False, "tag_count": True},
+            return_document = ReturnDocument.AFTER
+        )
+        return stream["tag_count"] - count if stream else None
+
+    async def add_many(self, vid_id, tags):
+        # tags is a list of {"_id", "author_id", "timestamp", "text"}, stored with one counter update and one insert
+        # positions are written onto the tags themselves, so retrying with the same list doesn't reserve them again
+        # and tags a failed attempt already inserted are skipped
+        # returns the stored tags, or [] (tags dropped) if the stream doesn't exist
+        unplaced = [tag for tag in tags if "seq" not in tag]
+        if unplaced:
+            first = await self.reserve(vid_id, len(unplaced))
+            if first is None:
+                print("Dropping {} tags of missing stream {}".format(len(tags), vid_id))
+                return []
+            for i, tag in enumerate(unplaced):
+                tag["seq"] = first + i
+        docs = [dict(tag, vid_id = vid_id) for tag in tags]
+        try:
+            await self.tags.insert_many(docs, ordered = False)
+        except BulkWriteError as e:
+            # 11000: duplicate key, already inserted by an earlier attempt
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+        return docs
+
+    async def add(self, vid_id, author_id, text, timestamp):
+        docs = await self.add_many(vid_id, [{"_id": ObjectId(), "author_id": author_id, "timestamp": timestamp, "text": text}])
+        return docs[0] if docs else None
+
+    async def iter_batches(self, vid_id, legacy_tags = None, batch_size = 500):
+        # yields the stream's tags in order, batch_size at a time
+        # legacy_tags is the old {"0": tag, "1": tag, ...} dict of a stream document, which comes first
+        if legacy_tags:
+            tags = [legacy_tags[str(k)] for k in range(len(legacy_tags))]
+            for i in range(0, len(tags), batch_size):
+                yield tags[i:i + batch_size]
+        async for batch in self.tags.find_batches({"vid_id": vid_id}, sort = [("seq", ASCENDING)], batch_size = batch_size):
+            yield batch
+
+    async def set_seconds(self, tags):
+        # write back seconds computed for tags read from the collection
+        if tags:
+            await self.tags.bulk_write([UpdateOne({"_id": tag["_id"]}, {"$set": {"seconds": tag["seconds"]}}) for tag in tags], ordered = False)
+
+class TagBuffer:
+    # tags waiting to be written, per stream, flushed every flush_interval seconds
+    # or as soon as max_pending tags are waiting
+    # the same text tagged again on a stream within duplicate_window seconds is dropped
+
+    def __init__(self, store, flush_interval = 5, max_pending = 50, duplicate_window = 10):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.duplicate_window = duplicate_window
+        self.pending = {}
+        self.recent = {}
+        self.lock = asyncio.Lock()
+        self.full = asyncio.Event()
+
+    def __len__(self):
+        return sum(len(tags) for tags in self.pending.values())
+
+    def add(self, vid_id, author_id, text, timestamp):
+        # returns False if the tag was collapsed into an identical recent one
+        key = (vid_id, text)
+        last = self.recent.get(key)
+        if last and (timestamp - last).total_seconds() < self.duplicate_window:
+            return False
+        self.recent[key] = timestamp
+        self.pending.setdefault(vid_id, []).append({"_id": ObjectId(), "author_id": author_id, "timestamp": timestamp, "text": text})
+        if len(self) >= self.max_pending:
+            self.full.set()
+        return True
+
+    async def flush(self, vid_id = None):
+        # write pending tags (of one stream, or all of them) to the store
+        async with self.lock:
+            for vid in ([vid_id] if vid_id else list(self.pending)):
+                tags = self.pending.pop(vid, None)
+                if not tags:
+                    continue
+                try:
+                    await self.store.add_many(vid, tags)
+                except Exception:
+                    # keep them, in order, for the next flush
+                    self.pending[vid] = tags + self.pending.get(vid, [])
+                    raise
+
+            # forget tags that can no longer be duplicated
+            if self.recent:
+                newest = max(self.recent.values())
+                self.recent = {key: timestamp for key, timestamp in self.recent.items() if (newest - timestamp).total_seconds() < self.duplicate_window}
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), timeout = self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print("Tag buffer flush failed: {!r}".format(e))
+
+if __name__ == "__main__":
+    # benchmarks against a throwaway database:
+    # - tagging a 5,000 tag stream, dict on the stream document vs stream_tags
+    # - bytes loaded per stream poll, full documents vs StreamRepository projections
+    # usage: MONGO_URL=mongodb://localhost:27017 python streams.py
+    import os
+    import time
+    from datetime import datetime as dtime, timezone
+    import bson
+    from pymongo import MongoClient
+    from database import Database
+
+    tag_total = 5000
+    mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+    db_name = "botan_tag_benchmark"
+
+    async def main():
+        db = Database()
+        await db.connect(lambda: MongoClient(mongo_url)[db_name])
+        await db.run(lambda: db.pymongo_db.client.drop_database(db_name))
+        text = "botan ate the whole cake " * 4
+
+        # old: read the stream, add to the dict in python, write the whole dict back
+        await db["streams"].insert_one({"id": "dict", "tag_count": 0, "tags": {}})
+        start = time.perf_counter()
+        for i in range(tag_total):
+            vid_data = await db["streams"].find_one({"id": "dict"})
+            vid_data["tags"][str(vid_data["tag_count"])] = {"author_id": i, "timestamp": dtime.now(tz = timezone.utc), "text": text}
+            vid_data["tag_count"] += 1
+            await db["streams"].update_one({"id": "dict"}, {"$set": {"tags": vid_data["tags"], "tag_count": vid_data["tag_count"]}})
+        old_seconds = time.perf_counter() - start
+
+        # new: atomic counter and one insert per tag
+        store = TagStore(db)
+        await store.create_indexes()
+        await db["streams"].insert_one({"id": "collection", "tag_count": 0})
+        start = time.perf_counter()
+        for i in range(tag_total):
+            await store.add("collection", i, text, dtime.now(tz = timezone.utc))
+        new_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        read = 0
+        async for batch in store.iter_batches("collection"):
+            read += len(batch)
+        read_seconds = time.perf_counter() - start
+
+        print("dict on stream document: {:.1f}s ({:.2f}ms per tag)".format(old_seconds, old_seconds / tag_total * 1000))
+        print("stream_tags collection: {:.1f}s ({:.2f}ms per tag)".format(new_seconds, new_seconds / tag_total * 1000))
+        print("read back {} tags in batches: {:.2f}s".format(read, read_seconds))
+
+        # 200 archived streams with 2,000 legacy tags each, one live stream and two upcoming ones
+        now = dtime.now(tz = timezone.utc)
+        tags = {str(i): {"author_id": i, "timestamp": now, "seconds": i, "text": text} for i in range(2000)}
+        archived = [{"id": "archived{}".format(i), "title": text, "status": "completed", "tag_count": 2000, "tags": tags} for i in range(200)]
+        await db["streams"].delete_many({})
+        await db["streams"].insert_many(archived)
+        await db["streams"].insert_many([
+            {"id": "live", "title": text, "status": "live", "live_msg": 1, "scheduled_start_time": now, "tag_count": 2000, "tags": tags},
+            {"id": "upcoming0", "title": text, "status": "upcoming", "scheduled_start_time": now},
+            {"id": "upcoming1", "title": text, "status": "upcoming", "scheduled_start_time": now}
+        ])
+        searched = ["archived{}".format(i) for i in range(25)]
+
+        def size(docs):
+            return sum(len(bson.encode(doc)) for doc in docs)
+
+        # old: update_streams and find_streams loaded full documents, one find_one per search result
+        old_bytes = size(await db["streams"].find({"status": "live"}))
+        old_bytes += size(await db["streams"].find({"$or": [{"status": "upcoming"}, {"status": "justlive"}]}))
+        for vid_id in searched:
+            old_bytes += size([await db["streams"].find_one({"id": vid_id})])
+
+        repo = StreamRepository(db)
+        await repo.create_indexes()
+        new_bytes = size(await repo.by_status(("live",), ("id", "live_msg", "end")))
+        new_bytes += size(await repo.by_status(("upcoming", "justlive"), ("id", "status", "scheduled_start_time")))
+        new_bytes += size({"id": vid_id} for vid_id in await repo.existing_ids(searched))
+
+        print("stream poll payload, full documents: {:,} bytes".format(old_bytes))
+        print("stream poll payload, projections: {:,} bytes".format(new_bytes))
+        await db.run(lambda: db.pymongo_db.client.drop_database(db_name))
+
+    asyncio.get_event_loop().run_until_complete(main())
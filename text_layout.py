@@ -0,0 +1,115 @@
+# Text layout for image renderers
+#
+# Greedy word wrapping that measures every word once. Advance widths are cached
+# per (font, text), so repeated words and repeated renders cost a dict lookup
+# instead of a FreeType layout pass.
+
+# python built-in libraries
+from functools import lru_cache
+
+## spacing pillow puts between lines of multiline text
+line_spacing = 4
+
+@lru_cache(maxsize = 8192)
+def text_width(font, text):
+    return font.getsize(text)[0]
+
+@lru_cache(maxsize = 256)
+def line_height(font):
+    # same reference glyph pillow uses for multiline text
+    return font.getsize("A")[1]
+
+def block_height(font, line_count):
+    return line_count * (line_height(font) + line_spacing) - line_spacing
+
+def lines_that_fit(font, max_height):
+    return max(1, (max_height + line_spacing) // (line_height(font) + line_spacing))
+
+def _wrap_paragraph(paragraph, font, max_width):
+    space = text_width(font, " ")
+    lines = []
+    words = []
+    width = 0
+    for word in paragraph.split(" "):
+        word_width = text_width(font, word)
+        if words and width + space + word_width > max_width:
+            lines.append((" ".join(words), width))
+            words, width = [word], word_width
+        else:
+            width += (space if words else 0) + word_width
+            words.append(word)
+    lines.append((" ".join(words), width))
+    return lines
+
+def _truncate(line, font, max_width, ellipsis = "..."):
+    # drop words from the end until the line plus ellipsis fits
+    words = line.split(" ")
+    while len(words) > 1 and text_width(font, " ".join(words) + ellipsis) > max_width:
+        words.pop()
+    return " ".join(words) + ellipsis
+
+def wrap_text(text, font, max_width, max_lines = None):
+    # wrap text to max_width, returns (wrapped text, (width, height))
+    # explicit newlines are kept, lines past max_lines are cut off with an ellipsis
+    lines = []
+    for paragraph in text.split("\n"):
+        lines.extend(_wrap_paragraph(paragraph, font, max_width))
+
+    if max_lines and len(lines) > max_lines:
+        lines = lines[:max_lines]
+        last_line = _truncate(lines[-1][0], font, max_width)
+        lines[-1] = (last_line, text_width(font, last_line))
+
+    width = max(line_width for line, line_width in lines)
+    return "\n".join(line for line, line_width in lines), (width, block_height(font, len(lines)))
+
+def fit_text(text, font_for_size, size, max_width, max_height, min_size = 12):
+    # wrap text, shrinking the font until the block fits inside max_width x max_height
+    # font_for_size(size) returns a font, returns (font, wrapped text, (width, height))
+    while True:
+        font = font_for_size(size)
+        wrapped, (width, height) = wrap_text(text, font, max_width)
+        if height <= max_height or size <= min_size:
+            break
+        size = max(min_size, int(size * 0.9))
+
+    # still too tall at the smallest size, cut lines off instead
+    if height > max_height:
+        wrapped, (width, height) = wrap_text(text, font, max_width, max_lines = lines_that_fit(font, max_height))
+    return font, wrapped, (width, height)
+
+if __name__ == "__main__":
+    # benchmark: wrapping a 2,000 character superchat message
+    import random
+    import timeit
+    from PIL import Image, ImageDraw, ImageFont
+
+    random.seed(0)
+    words = ["botan", "lion", "simp", "poi", "shishiro", "gao", "bodan", "superchat", "nene", "lalion"]
+    message = ""
+    while len(message) < 2000:
+        message += random.choice(words) + " "
+    message = message.strip()
+
+    font = ImageFont.truetype("fonts/Roboto-Regular.ttf", size = 40)
+    idraw = ImageDraw.Draw(Image.new("RGB", (690, 687)))
+
+    def quadratic():
+        m, *rest = message.split(" ")
+        for word in rest:
+            if idraw.textsize(m + " " + word, font)[0] > 660:
+                m += "\n" + word
+            else:
+                m += " " + word
+        return idraw.textsize(m, font)
+
+    def cold():
+        text_width.cache_clear()
+        return wrap_text(message, font, 660)
+
+    def warm():
+        return wrap_text(message, font, 660)
+
+    for name, func in (("quadratic", quadratic), ("linear, cold cache", cold), ("linear, warm cache", warm)):
+        per_call = timeit.timeit(func, number = 5) / 5
+        print("{}: {:.2f}ms".format(name, per_call * 1000))
@@ -0,0 +1,186 @@
+# Async YouTube Data API client
+#
+# Talks to the REST api directly through one pooled aiohttp session, with per
+# call timeouts and retry with backoff. Every call is charged to a quota ledger
+# stored in db["settings"] so the background loops can slow down before the
+# daily quota runs out.
+
+# external libraries
+import aiohttp
+
+# python built-in libraries
+import asyncio
+from datetime import datetime as dtime
+from datetime import timezone, timedelta
+
+"""quota ledger document in db["settings"]
+{
+    "name": "youtube_quota",
+    "days": {
+        "2021-02-14": {
+            "search_list": 400,
+            "videos_list": 120,
+            ...
+        },
+        ...
+    }
+}
+mongo treats dots in keys as paths, so endpoints are stored with "_" instead of "."
+only the last keep_days days are kept
+"""
+
+def ledger_key(endpoint):
+    return endpoint.replace(".", "_")
+
+class QuotaExceeded(Exception):
+    pass
+
+# what a request can still raise once its retries are used up
+RequestFailed = (aiohttp.ClientError, asyncio.TimeoutError)
+
+class YouTubeClient:
+    base_url = "https://www.googleapis.com/youtube/v3/"
+
+    # quota units charged per call
+    costs = {
+        "search.list": 100,
+        "videos.list": 1,
+        "channels.list": 1
+    }
+
+    # the daily quota resets at midnight pacific time (fixed offset, close enough for accounting)
+    quota_tz = timezone(timedelta(hours = -8))
+
+    retry_statuses = {429, 500, 502, 503, 504}
+
+    def __init__(self, api_key, settings, budget = 9000, timeout = 10, retries = 3, backoff = 1, max_connections = 10, keep_days = 7):
+        self.api_key = api_key
+        self.settings = settings
+        self.budget = budget
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.keep_days = keep_days
+        self.session = None
+        self.ledger = {}
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit = self.max_connections)
+        self.session = aiohttp.ClientSession(connector = connector, timeout = aiohttp.ClientTimeout(total = self.timeout))
+        ledger = await self.settings.find_one({"name": "youtube_quota"})
+        if ledger:
+            for day, usage in ledger.get("days", {}).items():
+                self.ledger[day] = self._flatten(usage)
+        await self._prune()
+        return self
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    ## quota accounting
+    @staticmethod
+    def _flatten(usage, prefix = ""):
+        # {"search": {"list": 100}} (ledgers written with dotted keys) -> {"search_list": 100}
+        flat = {}
+        for key, units in usage.items():
+            if isinstance(units, dict):
+                flat.update(YouTubeClient._flatten(units, prefix + key + "_"))
+            else:
+                flat[prefix + key] = flat.get(prefix + key, 0) + units
+        return flat
+
+    async def _prune(self):
+        # drop days older than keep_days, in memory and in the stored ledger
+        cutoff = (dtime.now(tz = self.quota_tz) - timedelta(days = self.keep_days)).strftime("%Y-%m-%d")
+        old_days = [day for day in self.ledger if day <= cutoff]
+        for day in old_days:
+            del self.ledger[day]
+        if old_days:
+            await self.settings.update_one(
+                {"name": "youtube_quota"},
+                {"$unset": {"days.{}".format(day): "" for day in old_days}}
+            )
+
+    def today(self):
+        return dtime.now(tz = self.quota_tz).strftime("%Y-%m-%d")
+
+    def units_today(self):
+        return sum(self.ledger.get(self.today(), {}).values())
+
+    def over_budget(self, units = 0):
+        # true if spending these extra units would go past the daily budget
+        return self.units_today() + units > self.budget
+
+    async def _charge(self, endpoint, units):
+        day = self.today()
+        new_day = day not in self.ledger
+        key = ledger_key(endpoint)
+        usage = self.ledger.setdefault(day, {})
+        usage[key] = usage.get(key, 0) + units
+        await self.settings.update_one(
+            {"name": "youtube_quota"},
+            {"$inc": {"days.{}.{}".format(day, key): units}},
+            upsert = True
+        )
+        if new_day:
+            await self._prune()
+
+    ## requests
+    async def _get(self, resource, params):
+        endpoint = resource + ".list"
+        params = dict(params, key = self.api_key)
+        url = self.base_url + resource
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.session.get(url, params = params) as resp:
+                    # youtube charges quota for every request that reaches it
+                    await self._charge(endpoint, self.costs[endpoint])
+                    if resp.status == 403:
+                        data = await resp.json()
+                        reasons = {error.get("reason") for error in data.get("error", {}).get("errors", [])}
+                        if reasons & {"quotaExceeded", "dailyLimitExceeded"}:
+                            raise QuotaExceeded(endpoint)
+                    if resp.status not in self.retry_statuses:
+                        resp.raise_for_status()
+                        return await resp.json()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+            else:
+                if attempt == self.retries:
+                    raise aiohttp.ClientError("{} failed after {} retries".format(endpoint, self.retries))
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def search(self, channel_id, event_type, max_results = 25):
+        data = await self._get("search", {
+            "part": "snippet",
+            "channelId": channel_id,
+            "eventType": event_type,
+            "maxResults": max_results,
+            "type": "video"
+        })
+        return data["items"]
+
+    async def videos(self, vid_ids, part):
+        # fetch many videos with as few calls as possible (the api accepts 50 ids per call)
+        # returns {vid id: video item}, videos that youtube doesn't return are left out
+        vid_ids = list(dict.fromkeys(vid_ids))
+        videos = {}
+        for i in range(0, len(vid_ids), 50):
+            data = await self._get("videos", {
+                "part": part,
+                "id": ",".join(vid_ids[i:i + 50]),
+                "maxResults": 50
+            })
+            for item in data["items"]:
+                videos[item["id"]] = item
+        return videos
+
+    async def channels(self, ch_ids, part):
+        data = await self._get("channels", {
+            "part": part,
+            "id": ",".join(ch_ids)
+        })
+        return {item["id"]: item for item in data["items"]}